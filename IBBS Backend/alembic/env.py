@@ -9,9 +9,16 @@ from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 from alembic import context
 
+try:
+    import uvloop
+except ImportError:  # optional; ships with uvicorn[standard]
+    uvloop = None
+
 # ensure app package is importable
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from app.config import settings
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+from app.config import DB_URL_STR
 from app.db.base import Base
 
 # this is the Alembic Config object, which provides
@@ -28,9 +35,8 @@ target_metadata = Base.metadata
 
 
 def run_migrations_offline():
-    url = str(settings.DATABASE_URL)
     context.configure(
-        url=url,
+        url=DB_URL_STR,
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
@@ -41,6 +47,8 @@ def run_migrations_offline():
 
 
 def do_run_migrations(connection: Connection):
+    # migration DDL runs once; don't fill the statement cache with it
+    connection = connection.execution_options(compiled_cache=None)
     context.configure(connection=connection, target_metadata=target_metadata)
 
     with context.begin_transaction():
@@ -49,7 +57,7 @@ def do_run_migrations(connection: Connection):
 
 async def run_migrations_online():
     connectable = create_async_engine(
-        str(settings.DATABASE_URL),
+        DB_URL_STR,
         poolclass=pool.NullPool,
     )
 
@@ -62,4 +70,6 @@ async def run_migrations_online():
 if context.is_offline_mode():
     run_migrations_offline()
 else:
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     asyncio.run(run_migrations_online())
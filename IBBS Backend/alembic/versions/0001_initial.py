@@ -4,9 +4,13 @@ Revision ID: 0001_initial
 Revises: 
 Create Date: 2025-12-17 00:00:00.000000
 """
+from datetime import date
+from decimal import Decimal
+
 from alembic import op
 import sqlalchemy as sa
 from sqlalchemy.dialects import postgresql
+from sqlalchemy.util import await_only
 
 # revision identifiers, used by Alembic.
 revision = '0001_initial'
@@ -14,11 +18,82 @@ down_revision = None
 branch_labels = None
 depends_on = None
 
+SEED_ROUTE_COLUMNS = ('origin', 'destination', 'distance_km')
+SEED_ROUTES = [
+    ('Kampala', 'Gulu', Decimal('330.00')),
+    ('Kampala', 'Arua', Decimal('420.00')),
+    ('Kampala', 'Mbale', Decimal('225.00')),
+]
+SEED_BATCH_SIZE = 500
+
+# payments.status stays varchar: it stores whatever status string the provider reports
+TRIP_STATUS = postgresql.ENUM(
+    'scheduled', 'boarding', 'departed', 'arrived', 'cancelled', name='trip_status', create_type=False,
+)
+BOOKING_STATUS = postgresql.ENUM(
+    'pending', 'confirmed', 'paid', 'cancelled', name='booking_status', create_type=False,
+)
+
+# range-partitioned by created_at; the app's beat task keeps monthly partitions ahead of time
+PARTITIONED_TABLES = ('audit_logs', 'notifications')
+
+
+def _asyncpg_connection():
+    """Return the raw asyncpg connection behind the migration bind, or None for other drivers / --sql mode."""
+    if op.get_context().as_sql:
+        return None
+    bind = op.get_bind()
+    if bind.dialect.driver != 'asyncpg':
+        return None
+    return bind.connection.driver_connection
+
+
+def _execute_bundle(elements):
+    """Execute DDL elements as one semicolon-separated script.
+
+    SQLAlchemy's asyncpg adapter prepares every statement it runs, and a
+    prepared statement cannot hold more than one command, so the script is
+    handed to the raw driver connection, which sends it as a single
+    simple-query message. The migration transaction is already open on that
+    connection (Alembic has touched alembic_version by now), so the bundle
+    commits or rolls back with the rest of the migration.
+    """
+    if op.get_context().as_sql:
+        for element in elements:
+            op.execute(element)
+        return
+    bind = op.get_bind()
+    script = ";\n".join(str(element.compile(dialect=bind.dialect)) for element in elements)
+    raw = _asyncpg_connection()
+    if raw is not None:
+        await_only(raw.execute(script))
+    else:
+        bind.exec_driver_sql(script)
+
+
+def _month_partitions(table, months=2):
+    """DEFAULT partition plus one partition per month, starting with the current one."""
+    start = date.today().replace(day=1)
+    ddl = [sa.DDL(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')]
+    for _ in range(months):
+        end = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+        ddl.append(sa.DDL(
+            f"CREATE TABLE {table}_{start:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+        ))
+        start = end
+    return ddl
+
 
 def upgrade():
-    # ### commands auto generated ###
-    op.create_table('users',
-        sa.Column('id', sa.Integer(), primary_key=True),
+    bind = op.get_bind()
+    TRIP_STATUS.create(bind)
+    BOOKING_STATUS.create(bind)
+
+    metadata = sa.MetaData()
+
+    sa.Table('users', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
         sa.Column('email', sa.String(length=255), nullable=False),
         sa.Column('phone', sa.String(length=32), nullable=True),
         sa.Column('full_name', sa.String(length=255), nullable=True),
@@ -29,21 +104,19 @@ def upgrade():
         sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
         sa.UniqueConstraint('email', name='users_email_key'),
     )
-    op.create_index('ix_users_email', 'users', ['email'], unique=False)
 
-    op.create_table('operators',
-        sa.Column('id', sa.Integer(), primary_key=True),
+    sa.Table('operators', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
         sa.Column('name', sa.String(length=255), nullable=False),
         sa.Column('contact_email', sa.String(length=255), nullable=True),
         sa.Column('contact_phone', sa.String(length=32), nullable=True),
         sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
         sa.UniqueConstraint('name', name='operators_name_key'),
     )
-    op.create_index('ix_operators_name', 'operators', ['name'], unique=False)
 
-    op.create_table('buses',
-        sa.Column('id', sa.Integer(), primary_key=True),
-        sa.Column('operator_id', sa.Integer(), nullable=True),
+    buses = sa.Table('buses', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
+        sa.Column('operator_id', sa.BigInteger(), nullable=True),
         sa.Column('registration_number', sa.String(length=64), nullable=False),
         sa.Column('capacity', sa.Integer(), nullable=False, server_default='0'),
         sa.Column('model', sa.String(length=128), nullable=True),
@@ -51,11 +124,10 @@ def upgrade():
         sa.ForeignKeyConstraint(['operator_id'], ['operators.id'], ondelete='SET NULL'),
         sa.UniqueConstraint('registration_number', name='buses_registration_number_key'),
     )
-    op.create_index('ix_buses_registration_number', 'buses', ['registration_number'], unique=False)
-    op.create_index('ix_buses_operator_id', 'buses', ['operator_id'], unique=False)
+    sa.Index('ix_buses_operator_id', buses.c.operator_id)
 
-    op.create_table('routes',
-        sa.Column('id', sa.Integer(), primary_key=True),
+    routes = sa.Table('routes', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
         sa.Column('origin', sa.String(length=128), nullable=False),
         sa.Column('destination', sa.String(length=128), nullable=False),
         sa.Column('distance_km', sa.Numeric(8, 2), nullable=True),
@@ -63,38 +135,37 @@ def upgrade():
         sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
         sa.UniqueConstraint('origin', 'destination', name='uq_route_origin_destination'),
     )
-    op.create_index('ix_routes_origin', 'routes', ['origin'], unique=False)
-    op.create_index('ix_routes_destination', 'routes', ['destination'], unique=False)
-
-    op.create_table('trips',
-        sa.Column('id', sa.Integer(), primary_key=True),
-        sa.Column('route_id', sa.Integer(), nullable=False),
-        sa.Column('bus_id', sa.Integer(), nullable=True),
-        sa.Column('operator_id', sa.Integer(), nullable=True),
+    sa.Index('ix_routes_destination', routes.c.destination)
+
+    trips = sa.Table('trips', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
+        sa.Column('route_id', sa.BigInteger(), nullable=False),
+        sa.Column('bus_id', sa.BigInteger(), nullable=True),
+        sa.Column('operator_id', sa.BigInteger(), nullable=True),
         sa.Column('departure_time', sa.DateTime(timezone=True), nullable=False),
         sa.Column('arrival_time', sa.DateTime(timezone=True), nullable=True),
-        sa.Column('status', sa.String(length=50), nullable=False, server_default='scheduled'),
+        sa.Column('status', TRIP_STATUS, nullable=False, server_default='scheduled'),
         sa.Column('seats_available', sa.Integer(), nullable=False, server_default='0'),
         sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
         sa.ForeignKeyConstraint(['route_id'], ['routes.id'], ondelete='CASCADE'),
         sa.ForeignKeyConstraint(['bus_id'], ['buses.id'], ondelete='SET NULL'),
         sa.ForeignKeyConstraint(['operator_id'], ['operators.id'], ondelete='SET NULL'),
     )
-    op.create_index('ix_trips_route_id', 'trips', ['route_id'], unique=False)
-    op.create_index('ix_trips_departure_time', 'trips', ['departure_time'], unique=False)
+    # "trips on route X from time T, soonest first" is a single range scan
+    sa.Index('ix_trips_route_departure', trips.c.route_id, trips.c.departure_time)
 
-    op.create_table('seatmaps',
-        sa.Column('id', sa.Integer(), primary_key=True),
-        sa.Column('bus_id', sa.Integer(), nullable=False),
-        sa.Column('layout', postgresql.JSON(), nullable=True),
+    seatmaps = sa.Table('seatmaps', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
+        sa.Column('bus_id', sa.BigInteger(), nullable=False),
+        sa.Column('layout', postgresql.JSONB(), nullable=True),
         sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
         sa.ForeignKeyConstraint(['bus_id'], ['buses.id'], ondelete='CASCADE'),
     )
-    op.create_index('ix_seatmaps_bus_id', 'seatmaps', ['bus_id'], unique=False)
+    sa.Index('ix_seatmaps_bus_id', seatmaps.c.bus_id)
 
-    op.create_table('seats',
-        sa.Column('id', sa.Integer(), primary_key=True),
-        sa.Column('seatmap_id', sa.Integer(), nullable=False),
+    seats = sa.Table('seats', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
+        sa.Column('seatmap_id', sa.BigInteger(), nullable=False),
         sa.Column('seat_number', sa.String(length=32), nullable=False),
         sa.Column('row', sa.Integer(), nullable=True),
         sa.Column('column', sa.Integer(), nullable=True),
@@ -103,11 +174,11 @@ def upgrade():
         sa.ForeignKeyConstraint(['seatmap_id'], ['seatmaps.id'], ondelete='CASCADE'),
         sa.UniqueConstraint('seatmap_id', 'seat_number', name='uq_seatmap_seat_number'),
     )
-    op.create_index('ix_seats_seatmap_id', 'seats', ['seatmap_id'], unique=False)
+    sa.Index('ix_seats_seatmap_id', seats.c.seatmap_id)
 
-    op.create_table('fares',
-        sa.Column('id', sa.Integer(), primary_key=True),
-        sa.Column('route_id', sa.Integer(), nullable=False),
+    fares = sa.Table('fares', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
+        sa.Column('route_id', sa.BigInteger(), nullable=False),
         sa.Column('amount', sa.Numeric(10, 2), nullable=False),
         sa.Column('currency', sa.String(length=8), nullable=False, server_default='UGX'),
         sa.Column('travel_class', sa.String(length=50), nullable=False, server_default='economy'),
@@ -115,14 +186,14 @@ def upgrade():
         sa.Column('effective_to', sa.DateTime(timezone=True), nullable=True),
         sa.ForeignKeyConstraint(['route_id'], ['routes.id'], ondelete='CASCADE'),
     )
-    op.create_index('ix_fare_route_class', 'fares', ['route_id', 'travel_class'], unique=False)
-
-    op.create_table('bookings',
-        sa.Column('id', sa.Integer(), primary_key=True),
-        sa.Column('user_id', sa.Integer(), nullable=True),
-        sa.Column('trip_id', sa.Integer(), nullable=False),
-        sa.Column('seat_id', sa.Integer(), nullable=True),
-        sa.Column('status', sa.String(length=50), nullable=False, server_default='pending'),
+    sa.Index('ix_fare_route_class', fares.c.route_id, fares.c.travel_class)
+
+    bookings = sa.Table('bookings', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
+        sa.Column('user_id', sa.BigInteger(), nullable=True),
+        sa.Column('trip_id', sa.BigInteger(), nullable=False),
+        sa.Column('seat_id', sa.BigInteger(), nullable=True),
+        sa.Column('status', BOOKING_STATUS, nullable=False, server_default='pending'),
         sa.Column('total_amount', sa.Numeric(10, 2), nullable=False, server_default='0'),
         sa.Column('booked_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
         sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
@@ -130,11 +201,18 @@ def upgrade():
         sa.ForeignKeyConstraint(['seat_id'], ['seats.id'], ondelete='SET NULL'),
         sa.UniqueConstraint('trip_id', 'seat_id', name='uq_trip_seat'),
     )
-    op.create_index('ix_bookings_trip_id', 'bookings', ['trip_id'], unique=False)
+    # covers "bookings for trip X in status S" without touching the heap
+    sa.Index(
+        'ix_bookings_trip_status', bookings.c.trip_id, bookings.c.status,
+        postgresql_include=['user_id', 'seat_id'],
+    )
+    # keyset pages of the admin bookings view, filtered by trip or by status
+    sa.Index('ix_bookings_trip_id_id', bookings.c.trip_id, bookings.c.id)
+    sa.Index('ix_bookings_status_id', bookings.c.status, bookings.c.id)
 
-    op.create_table('payments',
-        sa.Column('id', sa.Integer(), primary_key=True),
-        sa.Column('booking_id', sa.Integer(), nullable=False),
+    payments = sa.Table('payments', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
+        sa.Column('booking_id', sa.BigInteger(), nullable=False),
         sa.Column('amount', sa.Numeric(10, 2), nullable=False),
         sa.Column('currency', sa.String(length=8), nullable=False, server_default='UGX'),
         sa.Column('provider', sa.String(length=128), nullable=True),
@@ -144,67 +222,87 @@ def upgrade():
         sa.ForeignKeyConstraint(['booking_id'], ['bookings.id'], ondelete='CASCADE'),
         sa.UniqueConstraint('provider_ref', name='payments_provider_ref_key'),
     )
-    op.create_index('ix_payments_booking_id', 'payments', ['booking_id'], unique=False)
+    sa.Index('ix_payments_booking_id', payments.c.booking_id)
+    sa.Index('ix_payments_status', payments.c.status)
+    # revenue report: SUM(amount) over a paid_at range as an index-only scan
+    sa.Index('ix_payments_paid_at', payments.c.paid_at, postgresql_include=['amount'])
 
-    op.create_table('tickets',
-        sa.Column('id', sa.Integer(), primary_key=True),
-        sa.Column('booking_id', sa.Integer(), nullable=False),
+    tickets = sa.Table('tickets', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
+        sa.Column('booking_id', sa.BigInteger(), nullable=False),
         sa.Column('ticket_number', sa.String(length=128), nullable=False),
         sa.Column('issued_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
-        sa.Column('meta', postgresql.JSON(), nullable=True),
+        sa.Column('meta', postgresql.JSONB(), nullable=True),
         sa.ForeignKeyConstraint(['booking_id'], ['bookings.id'], ondelete='CASCADE'),
         sa.UniqueConstraint('ticket_number', name='tickets_ticket_number_key'),
     )
-    op.create_index('ix_tickets_booking_id', 'tickets', ['booking_id'], unique=False)
+    sa.Index('ix_tickets_booking_id', tickets.c.booking_id)
 
-    op.create_table('notifications',
-        sa.Column('id', sa.Integer(), primary_key=True),
-        sa.Column('user_id', sa.Integer(), nullable=True),
+    notifications = sa.Table('notifications', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
+        sa.Column('user_id', sa.BigInteger(), nullable=True),
         sa.Column('message', sa.String(length=1024), nullable=False),
         sa.Column('channel', sa.String(length=64), nullable=False, server_default='email'),
         sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
         sa.Column('read', sa.Boolean(), nullable=False, server_default=sa.text('false')),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), primary_key=True),
         sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+        postgresql_partition_by='RANGE (created_at)',
     )
-    op.create_index('ix_notifications_user_id', 'notifications', ['user_id'], unique=False)
+    sa.Index('ix_notifications_user_id', notifications.c.user_id)
 
-    op.create_table('audit_logs',
-        sa.Column('id', sa.Integer(), primary_key=True),
-        sa.Column('actor_id', sa.Integer(), nullable=True),
+    audit_logs = sa.Table('audit_logs', metadata,
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=False), primary_key=True),
+        sa.Column('actor_id', sa.BigInteger(), nullable=True),
         sa.Column('action', sa.String(length=255), nullable=False),
         sa.Column('object_type', sa.String(length=128), nullable=True),
         sa.Column('object_id', sa.String(length=128), nullable=True),
-        sa.Column('detail', postgresql.JSON(), nullable=True),
+        sa.Column('detail', postgresql.JSONB(), nullable=True),
         sa.Column('ip_address', sa.String(length=64), nullable=True),
-        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), primary_key=True),
         sa.ForeignKeyConstraint(['actor_id'], ['users.id'], ondelete='SET NULL'),
+        postgresql_partition_by='RANGE (created_at)',
     )
-    op.create_index('ix_audit_logs_actor_id', 'audit_logs', ['actor_id'], unique=False)
+    sa.Index('ix_audit_logs_actor_id', audit_logs.c.actor_id)
+    # containment queries (detail @> '{...}') for reporting
+    sa.Index('ix_audit_detail_gin', audit_logs.c.detail, postgresql_using='gin')
+
+    # tables first (in FK dependency order), then indexes once the tables exist
+    _execute_bundle([sa.schema.CreateTable(table) for table in metadata.sorted_tables])
+    _execute_bundle([ddl for table in PARTITIONED_TABLES for ddl in _month_partitions(table)])
+    _execute_bundle([
+        sa.schema.CreateIndex(index)
+        for table in metadata.sorted_tables
+        for index in sorted(table.indexes, key=lambda ix: ix.name)
+    ])
 
     # seed routes for Uganda
-    op.execute(
-        """
-        INSERT INTO routes (origin, destination, distance_km, active, created_at)
-        VALUES
-        ('Kampala','Gulu', 330.00, true, now()),
-        ('Kampala','Arua', 420.00, true, now()),
-        ('Kampala','Mbale', 225.00, true, now())
-        ON CONFLICT DO NOTHING;
-        """
-    )
-    # ### end Alembic commands ###
+    raw = _asyncpg_connection()
+    if raw is not None:
+        # COPY ships every row in a single protocol exchange
+        await_only(raw.copy_records_to_table('routes', records=SEED_ROUTES, columns=SEED_ROUTE_COLUMNS))
+    else:
+        rows = [dict(zip(SEED_ROUTE_COLUMNS, route)) for route in SEED_ROUTES]
+        # chunk to stay well under PostgreSQL's 65535 bind-parameter limit
+        for i in range(0, len(rows), SEED_BATCH_SIZE):
+            op.bulk_insert(routes, rows[i:i + SEED_BATCH_SIZE])
 
 
 def downgrade():
+    op.drop_index('ix_audit_detail_gin', table_name='audit_logs')
     op.drop_index('ix_audit_logs_actor_id', table_name='audit_logs')
     op.drop_table('audit_logs')
     op.drop_index('ix_notifications_user_id', table_name='notifications')
     op.drop_table('notifications')
     op.drop_index('ix_tickets_booking_id', table_name='tickets')
     op.drop_table('tickets')
+    op.drop_index('ix_payments_paid_at', table_name='payments')
+    op.drop_index('ix_payments_status', table_name='payments')
     op.drop_index('ix_payments_booking_id', table_name='payments')
     op.drop_table('payments')
-    op.drop_index('ix_bookings_trip_id', table_name='bookings')
+    op.drop_index('ix_bookings_status_id', table_name='bookings')
+    op.drop_index('ix_bookings_trip_id_id', table_name='bookings')
+    op.drop_index('ix_bookings_trip_status', table_name='bookings')
     op.drop_table('bookings')
     op.drop_index('ix_fare_route_class', table_name='fares')
     op.drop_table('fares')
@@ -212,16 +310,13 @@ def downgrade():
     op.drop_table('seats')
     op.drop_index('ix_seatmaps_bus_id', table_name='seatmaps')
     op.drop_table('seatmaps')
-    op.drop_index('ix_trips_departure_time', table_name='trips')
-    op.drop_index('ix_trips_route_id', table_name='trips')
+    op.drop_index('ix_trips_route_departure', table_name='trips')
     op.drop_table('trips')
     op.drop_index('ix_routes_destination', table_name='routes')
-    op.drop_index('ix_routes_origin', table_name='routes')
     op.drop_table('routes')
     op.drop_index('ix_buses_operator_id', table_name='buses')
-    op.drop_index('ix_buses_registration_number', table_name='buses')
     op.drop_table('buses')
-    op.drop_index('ix_operators_name', table_name='operators')
     op.drop_table('operators')
-    op.drop_index('ix_users_email', table_name='users')
     op.drop_table('users')
+    BOOKING_STATUS.drop(op.get_bind())
+    TRIP_STATUS.drop(op.get_bind())
@@ -4,8 +4,7 @@ from typing import List
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import get_session
 from app.models.models import User
-from sqlalchemy import select as sa_select
-from jose import JWTError
+from jwt import PyJWTError
 from app.services import auth as auth_service
 
 
@@ -13,21 +12,35 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_session)) -> User:
-    try:
-        user_id = auth_service.verify_access_token(token)
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
-    stmt = sa_select(User).where(User.id == int(user_id))
-    res = await db.execute(stmt)
-    user = res.scalars().first()
-    if not user or not user.is_active:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or inactive")
+    decoded = auth_service.token_cache.get(token)
+    if decoded is None:
+        try:
+            decoded = auth_service.decode_access_token(token)
+        except PyJWTError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
+        auth_service.token_cache[token] = decoded
+    user_id = decoded[0]
+    user = auth_service.user_cache.get(user_id)
+    if user is not None:
+        return user
+    principal = await auth_service.get_cached_principal(user_id)
+    if principal is None:
+        db_user = await db.get(User, int(user_id))
+        if not db_user or not db_user.is_active:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or inactive")
+        principal = await auth_service.cache_principal(db_user)
+    # detached, read-only stand-in carrying the cached columns; the process-wide cache is shared
+    # across requests, so it must never hold an instance bound to one request's session
+    user = User(**principal)
+    auth_service.user_cache[user_id] = user
     return user
 
 
 def role_required(allowed: List[str]):
+    allowed_set = frozenset(allowed)
+
     async def _dep(current_user: User = Depends(get_current_user)) -> User:
-        if current_user.role not in allowed and not current_user.is_superuser:
+        if not current_user.is_superuser and current_user.role not in allowed_set:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
         return current_user
 
@@ -1,4 +1,11 @@
+import asyncio
+import threading
+from datetime import timedelta
+from typing import Optional
+
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import worker_process_init
 from app.config import settings
 
 
@@ -6,6 +13,47 @@ celery_app = Celery(
     "ibbs_tasks",
     broker=settings.REDIS_URL,
     backend=settings.REDIS_URL,
+    include=["app.tasks", "app.notifications.tasks"],
 )
 
 celery_app.conf.update(task_track_started=True)
+
+celery_app.conf.beat_schedule = {
+    # idempotent; running daily means a missed run never leaves a month without its partition
+    "ensure-monthly-partitions": {
+        "task": "app.tasks.ensure_monthly_partitions",
+        "schedule": crontab(hour=0, minute=15),
+    },
+    "flush-audit-queue": {
+        "task": "app.tasks.flush_audit_queue",
+        "schedule": timedelta(seconds=5),
+    },
+}
+
+
+# One event loop per worker process, running in a background thread. Tasks submit their
+# coroutines to it, so async clients (Redis, DB pools) survive from one task to the next.
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+_worker_loop_lock = threading.Lock()
+
+
+def _ensure_worker_loop() -> asyncio.AbstractEventLoop:
+    global _worker_loop
+    with _worker_loop_lock:
+        if _worker_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="celery-asyncio", daemon=True).start()
+            _worker_loop = loop
+    return _worker_loop
+
+
+@worker_process_init.connect
+def _start_worker_loop(**_kwargs):
+    # runs in each prefork child after the fork, so every process gets its own loop
+    _ensure_worker_loop()
+
+
+def run_async(coro):
+    """Run `coro` on this process's worker loop and block until it finishes."""
+    loop = _worker_loop or _ensure_worker_loop()
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
@@ -1,3 +1,5 @@
+from typing import Final
+
 from pydantic import BaseSettings, AnyUrl
 
 
@@ -8,6 +10,11 @@ class Settings(BaseSettings):
     REDIS_URL: str = "redis://localhost:6379/0"
     SECRET_KEY: str = "replace-me"
     ALEMBIC_LOCATION: str = "alembic"
+    # Database connection pool
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: int = 5
+    DB_POOL_RECYCLE_SECONDS: int = 1800
     # JWT / auth settings
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
@@ -25,6 +32,11 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
+        # settings are read once at import; freezing makes that a guarantee
+        frozen = True
 
 
 settings = Settings()
+
+# DATABASE_URL is an AnyUrl; coerce it once for the engine and Alembic
+DB_URL_STR: Final[str] = str(settings.DATABASE_URL)
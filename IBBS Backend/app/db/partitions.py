@@ -0,0 +1,34 @@
+"""Monthly range partitions for the append-only tables.
+
+audit_logs and notifications are partitioned by created_at. Each month gets
+its own partition (``<table>_YYYY_MM``); rows outside every monthly range land
+in ``<table>_default``. Old months can be detached/dropped instead of deleted.
+"""
+from datetime import date
+from typing import List
+
+PARTITIONED_TABLES = ("audit_logs", "notifications")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(start: date) -> date:
+    return date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+
+
+def month_partition_ddl(table: str, start: date) -> str:
+    end = next_month(start)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table}_{start:%Y_%m} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+    )
+
+
+def ensure_partitions_ddl(today: date, months_ahead: int = 1) -> List[str]:
+    """DDL for the current month plus `months_ahead` future months of every partitioned table."""
+    starts = [month_start(today)]
+    for _ in range(months_ahead):
+        starts.append(next_month(starts[-1]))
+    return [month_partition_ddl(table, start) for table in PARTITIONED_TABLES for start in starts]
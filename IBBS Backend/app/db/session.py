@@ -1,13 +1,59 @@
+import asyncio
+import logging
+
+from sqlalchemy import LABEL_STYLE_TABLENAME_PLUS_COL, bindparam, event, select
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import async_sessionmaker
-from app.config import settings
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from app.config import settings, DB_URL_STR
+from app.models.models import User
+
+logger = logging.getLogger(__name__)
+
+# create async engine; the pool keeps authenticated connections around between requests
+engine = create_async_engine(
+    DB_URL_STR,
+    echo=settings.DEBUG,
+    future=True,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    # fail fast under saturation instead of queueing requests for the default 30s
+    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    pool_pre_ping=True,
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    # asyncpg's own statement cache plus SQLAlchemy's per-connection prepared statement cache
+    connect_args={"statement_cache_size": 1024, "prepared_statement_cache_size": 512},
+)
+
+# Celery workers: short-lived tasks on forked processes gain nothing from a pool, and a
+# pooled connection must never be shared across a fork. Creating it opens no connections.
+worker_engine = create_async_engine(DB_URL_STR, echo=settings.DEBUG, poolclass=NullPool)
 
+# Same SQL text as `session.get(User, pk)`, so the statement prepared here is the one
+# get_current_user hits in the per-connection prepared statement cache.
+_USER_BY_PK_SQL = str(
+    select(User)
+    .where(User.id == bindparam("pk_1"))
+    .set_label_style(LABEL_STYLE_TABLENAME_PLUS_COL)
+    .compile(dialect=engine.dialect)
+)
 
-DATABASE_URL = str(settings.DATABASE_URL)
 
-# create async engine
-engine = create_async_engine(DATABASE_URL, echo=settings.DEBUG, future=True)
+@event.listens_for(engine.sync_engine, "connect")
+def _prepare_hot_statements(dbapi_connection, connection_record):
+    if engine.dialect.driver != "asyncpg":
+        return
+    try:
+        cursor = dbapi_connection.cursor()
+        cursor.execute(_USER_BY_PK_SQL, (0,))
+        cursor.close()
+        dbapi_connection.rollback()
+    except Exception:
+        # the schema may not exist yet (fresh database); the statement is prepared lazily then
+        logger.debug("Could not prepare hot statements on new connection", exc_info=True)
+        dbapi_connection.rollback()
+
 
 # session factory
 async_session = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
@@ -16,3 +62,13 @@ async_session = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_c
 async def get_session() -> AsyncSession:  # to be used as dependency
     async with async_session() as session:
         yield session
+
+
+async def warm_pool(size: int = settings.DB_POOL_SIZE):
+    """Open `size` connections up front so the first requests don't pay connection setup."""
+    results = await asyncio.gather(*(engine.connect() for _ in range(size)), return_exceptions=True)
+    conns = [r for r in results if not isinstance(r, BaseException)]
+    if len(conns) < size:
+        logger.warning("Database pool warm-up opened %d/%d connections", len(conns), size)
+    # closing returns the connections to the pool rather than dropping them
+    await asyncio.gather(*(conn.close() for conn in conns))
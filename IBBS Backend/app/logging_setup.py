@@ -1,6 +1,7 @@
 import logging
 import sys
 import uuid
+import orjson
 from pythonjsonlogger import jsonlogger
 from contextvars import ContextVar
 
@@ -9,16 +10,26 @@ TRACE_ID_CTX: ContextVar[str] = ContextVar("trace_id", default=None)
 
 
 class TraceIdFilter(logging.Filter):
+    def __init__(self, name: str = ""):
+        super().__init__(name)
+        self._get = TRACE_ID_CTX.get
+
     def filter(self, record):
-        trace_id = TRACE_ID_CTX.get(None)
-        record.trace_id = trace_id
+        record.trace_id = self._get(None)
         return True
 
 
+class OrjsonFormatter(jsonlogger.JsonFormatter):
+    def jsonify_log_record(self, log_record):
+        return orjson.dumps(
+            log_record, default=self.json_default or str, option=orjson.OPT_NON_STR_KEYS
+        ).decode()
+
+
 def setup_logging(level: int = logging.INFO):
     root = logging.getLogger()
     handler = logging.StreamHandler(sys.stdout)
-    fmt = jsonlogger.JsonFormatter('%(asctime)s %(levelname)s %(name)s %(message)s %(trace_id)s')
+    fmt = OrjsonFormatter('%(asctime)s %(levelname)s %(name)s %(message)s %(trace_id)s')
     handler.setFormatter(fmt)
     handler.addFilter(TraceIdFilter())
     root.setLevel(level)
@@ -1,15 +1,35 @@
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import ORJSONResponse
 from app.config import settings
-import importlib
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from app.logging_setup import setup_logging, TRACE_ID_CTX
+import asyncio
+import logging
 import uuid
 import sentry_sdk
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 from app.metrics import update_queue_depth
-
-
-app = FastAPI(title=settings.APP_NAME)
+from app.db.session import warm_pool
+from app.services.auth import listen_for_invalidations
+from app.modules.auth.router import router as auth_router
+from app.modules.users.router import router as users_router
+from app.modules.operators.router import router as operators_router
+from app.modules.routes.router import router as routes_router
+from app.modules.trips.router import router as trips_router
+from app.modules.buses.router import router as buses_router
+from app.modules.seatmaps.router import router as seatmaps_router
+from app.modules.bookings.router import router as bookings_router
+from app.modules.payments.router import router as payments_router
+from app.modules.tickets.router import router as tickets_router
+from app.modules.notifications.router import router as notifications_router
+from app.modules.admin.router import router as admin_router
+from app.modules.reports.router import router as reports_router
+
+
+app = FastAPI(title=settings.APP_NAME, default_response_class=ORJSONResponse)
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH_REFRESH_SECONDS = 10
 
 # initialize logging and Sentry
 setup_logging()
@@ -26,32 +46,65 @@ async def add_trace_id(request: Request, call_next):
     response.headers["X-Trace-Id"] = trace_id
     return response
 
-# List of module names to include as routers
-MODULES = [
-    "auth",
-    "users",
-    "operators",
-    "routes",
-    "trips",
-    "buses",
-    "seatmaps",
-    "bookings",
-    "payments",
-    "tickets",
-    "notifications",
-    "admin",
-    "reports",
-]
-
-
-for mod in MODULES:
-    try:
-        pkg = importlib.import_module(f"app.modules.{mod}.router")
-        if hasattr(pkg, "router"):
-            app.include_router(pkg.router, prefix=f"/{mod}")
-    except Exception:
-        # module may be missing during initial scaffold
-        pass
+
+@app.on_event("startup")
+async def warm_db_pool():
+    await warm_pool()
+
+
+async def _queue_depth_refresher():
+    while True:
+        try:
+            await update_queue_depth()
+        except Exception:
+            logger.exception("Queue depth refresh failed")
+        await asyncio.sleep(QUEUE_DEPTH_REFRESH_SECONDS)
+
+
+@app.on_event("startup")
+async def start_queue_depth_refresher():
+    # keep Redis off the scrape path; /metrics serves whatever the refresher last set
+    app.state.queue_depth_task = asyncio.create_task(_queue_depth_refresher())
+
+
+@app.on_event("shutdown")
+async def stop_queue_depth_refresher():
+    task = getattr(app.state, "queue_depth_task", None)
+    if task is not None:
+        task.cancel()
+
+
+@app.on_event("startup")
+async def start_auth_invalidation_listener():
+    app.state.auth_invalidation_task = asyncio.create_task(listen_for_invalidations())
+
+
+@app.on_event("shutdown")
+async def stop_auth_invalidation_listener():
+    task = getattr(app.state, "auth_invalidation_task", None)
+    if task is not None:
+        task.cancel()
+
+
+# Routers are resolved once at import time; a module that fails to import is a startup error
+_ROUTERS = (
+    ("/auth", auth_router),
+    ("/users", users_router),
+    ("/operators", operators_router),
+    ("/routes", routes_router),
+    ("/trips", trips_router),
+    ("/buses", buses_router),
+    ("/seatmaps", seatmaps_router),
+    ("/bookings", bookings_router),
+    ("/payments", payments_router),
+    ("/tickets", tickets_router),
+    ("/notifications", notifications_router),
+    ("/admin", admin_router),
+    ("/reports", reports_router),
+)
+
+for prefix, router in _ROUTERS:
+    app.include_router(router, prefix=prefix)
 
 
 @app.get("/")
@@ -61,11 +114,6 @@ async def root():
 
 @app.get("/metrics")
 async def metrics():
-    # update dynamic gauges before scraping
-    try:
-        await update_queue_depth()
-    except Exception:
-        pass
     content = generate_latest()
     return Response(content=content, media_type=CONTENT_TYPE_LATEST)
 
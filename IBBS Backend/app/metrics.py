@@ -1,7 +1,6 @@
 from prometheus_client import Counter, Gauge, Histogram
 from app.redis_client import redis_client
-from typing import List
-import asyncio
+from typing import Dict, List
 
 # Notification DLQ depth
 NOTIF_DLQ_DEPTH = Gauge("ibbs_notification_dlq_depth", "Redis DLQ list length for notifications")
@@ -15,16 +14,24 @@ SEAT_LOCK_LATENCY = Histogram("ibbs_seat_lock_latency_seconds", "Latency for sea
 SEAT_LOCK_ATTEMPTS = Counter("ibbs_seat_lock_attempts_total", "Total seat lock attempts", ["result"])
 
 
+# Redis list key -> gauge reporting its length; all keys are read in one pipeline
+QUEUE_DEPTH_GAUGES: Dict[str, Gauge] = {
+    "notification_dlq": NOTIF_DLQ_DEPTH,
+}
+
+
 async def update_queue_depth(keys: List[str] = None):
     """Update queue depth gauges by measuring Redis list lengths for configured keys."""
-    keys = keys or ["notification_dlq"]
-    async def _get_len(k):
-        try:
-            return await redis_client.llen(k)
-        except Exception:
-            return 0
-
-    results = await asyncio.gather(*[_get_len(k) for k in keys])
-    # currently map first key to NOTIF_DLQ_DEPTH
-    if results:
-        NOTIF_DLQ_DEPTH.set(results[0])
+    keys = keys or list(QUEUE_DEPTH_GAUGES)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for k in keys:
+                pipe.llen(k)
+            results = await pipe.execute()
+    except Exception:
+        results = [0] * len(keys)
+
+    for k, depth in zip(keys, results):
+        gauge = QUEUE_DEPTH_GAUGES.get(k)
+        if gauge is not None:
+            gauge.set(depth)
@@ -1,15 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import ORJSONResponse
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select as sa_select, update as sa_update
-from app.db.session import get_session
+from sqlalchemy import func, insert as sa_insert, select as sa_select, update as sa_update
+from app.db.session import async_session, get_session
 from app.auth.deps import role_required, get_current_user
-from app.models.models import Operator, Bus, Trip, Booking, Payment
-from app.services.audit import log_audit
+from app.models.models import Operator, Bus, Trip, Booking, Payment, BOOKING_STATUSES
+from app.services.audit import enqueue_audit
+from app.services.report_cache import cached_report, report_version
 from datetime import datetime
 
 router = APIRouter()
 
+# keyset pagination for the list endpoints: `?limit=N&after_id=<last id of previous page>`.
+# Pages are returned as ORJSONResponse directly, skipping jsonable_encoder's per-value walk.
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 1000
+
+# provider statuses (lower-cased) that count as a settled payment
+PAYMENT_SUCCESS_STATUSES = ("success", "successful", "paid", "completed")
+
 
 @router.get("/")
 async def admin_root():
@@ -19,97 +31,118 @@ async def admin_root():
 # Fleet management: operators
 @router.post("/operators", dependencies=[Depends(role_required(["Admin", "OperatorManager"]))])
 async def create_operator(name: str, contact_email: Optional[str] = None, contact_phone: Optional[str] = None, db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
-    op = Operator(name=name, contact_email=contact_email, contact_phone=contact_phone)
-    async with db.begin():
-        db.add(op)
-        await log_audit(db, actor_id=current_user.id, action="create_operator", object_type="operator", object_id=str(name), detail={"email": contact_email, "phone": contact_phone})
-    return {"operator_id": op.id, "name": op.name}
+    ins = sa_insert(Operator).values(name=name, contact_email=contact_email, contact_phone=contact_phone).returning(Operator.id)
+    # the request session has usually autobegun already (auth reads through it); just commit it
+    operator_id = (await db.execute(ins)).scalar_one()
+    await db.commit()
+    await enqueue_audit(actor_id=current_user.id, action="create_operator", object_type="operator", object_id=str(operator_id), detail={"name": name, "email": contact_email, "phone": contact_phone})
+    return {"operator_id": operator_id, "name": name}
 
 
 @router.get("/operators", dependencies=[Depends(role_required(["Admin", "OperatorManager"]))])
-async def list_operators(db: AsyncSession = Depends(get_session)):
-    stmt = sa_select(Operator)
-    res = await db.execute(stmt)
-    ops = [dict(id=o.id, name=o.name, contact_email=o.contact_email) for o in res.scalars().all()]
-    return ops
+async def list_operators(limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX), after_id: Optional[int] = None, db: AsyncSession = Depends(get_session)):
+    stmt = sa_select(Operator.id, Operator.name, Operator.contact_email).order_by(Operator.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.where(Operator.id > after_id)
+    ops = [dict(id=id_, name=name, contact_email=email) async for id_, name, email in await db.stream(stmt)]
+    return ORJSONResponse(ops)
 
 
 @router.post("/buses", dependencies=[Depends(role_required(["Admin", "OperatorManager"]))])
 async def create_bus(operator_id: int, registration_number: str, capacity: int = 0, model: Optional[str] = None, db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
-    bus = Bus(operator_id=operator_id, registration_number=registration_number, capacity=capacity, model=model)
-    async with db.begin():
-        db.add(bus)
-        await log_audit(db, actor_id=current_user.id, action="create_bus", object_type="bus", object_id=registration_number, detail={"operator_id": operator_id, "capacity": capacity})
-    return {"bus_id": bus.id, "registration_number": bus.registration_number}
+    ins = sa_insert(Bus).values(operator_id=operator_id, registration_number=registration_number, capacity=capacity, model=model).returning(Bus.id)
+    bus_id = (await db.execute(ins)).scalar_one()
+    await db.commit()
+    await enqueue_audit(actor_id=current_user.id, action="create_bus", object_type="bus", object_id=registration_number, detail={"operator_id": operator_id, "capacity": capacity})
+    return {"bus_id": bus_id, "registration_number": registration_number}
 
 
 # Schedule CRUD (Trips)
 @router.post("/trips", dependencies=[Depends(role_required(["Admin", "OperatorManager"]))])
 async def create_trip(route_id: int, departure_time: datetime, arrival_time: Optional[datetime] = None, bus_id: Optional[int] = None, operator_id: Optional[int] = None, db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
-    trip = Trip(route_id=route_id, departure_time=departure_time, arrival_time=arrival_time, bus_id=bus_id, operator_id=operator_id, seats_available=0, status="scheduled")
-    async with db.begin():
-        db.add(trip)
-        await log_audit(db, actor_id=current_user.id, action="create_trip", object_type="trip", object_id=str(route_id), detail={"departure": departure_time.isoformat(), "bus_id": bus_id})
-    return {"trip_id": trip.id}
+    ins = sa_insert(Trip).values(route_id=route_id, departure_time=departure_time, arrival_time=arrival_time, bus_id=bus_id, operator_id=operator_id, seats_available=0, status="scheduled").returning(Trip.id)
+    trip_id = (await db.execute(ins)).scalar_one()
+    await db.commit()
+    await enqueue_audit(actor_id=current_user.id, action="create_trip", object_type="trip", object_id=str(route_id), detail={"departure": departure_time.isoformat(), "bus_id": bus_id})
+    return {"trip_id": trip_id}
 
 
 @router.get("/trips", dependencies=[Depends(role_required(["Admin", "OperatorManager"]))])
-async def list_trips(db: AsyncSession = Depends(get_session)):
-    stmt = sa_select(Trip)
-    res = await db.execute(stmt)
+async def list_trips(limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX), after_id: Optional[int] = None, db: AsyncSession = Depends(get_session)):
+    stmt = sa_select(Trip.id, Trip.route_id, Trip.departure_time, Trip.status).order_by(Trip.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.where(Trip.id > after_id)
     trips = []
-    for t in res.scalars().all():
-        trips.append({"id": t.id, "route_id": t.route_id, "departure_time": t.departure_time, "status": t.status})
-    return trips
+    async for id_, route_id, departure_time, trip_status in await db.stream(stmt):
+        trips.append({"id": id_, "route_id": route_id, "departure_time": departure_time, "status": trip_status})
+    return ORJSONResponse(trips)
 
 
 # Bookings view
 @router.get("/bookings", dependencies=[Depends(role_required(["Admin", "OperatorManager", "Agent"]))])
-async def view_bookings(trip_id: Optional[int] = None, status: Optional[str] = None, db: AsyncSession = Depends(get_session)):
-    stmt = sa_select(Booking)
+async def view_bookings(trip_id: Optional[int] = None, status: Optional[str] = None, limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX), after_id: Optional[int] = None, db: AsyncSession = Depends(get_session)):
+    # (trip_id, id) and (status, id) indexes serve the filtered pages
+    stmt = sa_select(Booking.id, Booking.trip_id, Booking.seat_id, Booking.status, Booking.booked_at).order_by(Booking.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.where(Booking.id > after_id)
     if trip_id:
         stmt = stmt.where(Booking.trip_id == trip_id)
     if status:
+        if status not in BOOKING_STATUSES:
+            raise HTTPException(status_code=400, detail="Unknown booking status")
         stmt = stmt.where(Booking.status == status)
-    res = await db.execute(stmt)
     out = [
-        {"id": b.id, "trip_id": b.trip_id, "seat_id": b.seat_id, "status": b.status, "booked_at": b.booked_at}
-        for b in res.scalars().all()
+        {"id": id_, "trip_id": trip_id_, "seat_id": seat_id, "status": booking_status, "booked_at": booked_at}
+        async for id_, trip_id_, seat_id, booking_status, booked_at in await db.stream(stmt)
     ]
-    return out
+    return ORJSONResponse(out)
 
 
 # Reports: revenue and reconciliation
 @router.get("/reports/revenue", dependencies=[Depends(role_required(["Admin"]))])
 async def revenue_report(start: Optional[datetime] = None, end: Optional[datetime] = None, db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
-    stmt = sa_select(Payment)
-    if start:
-        stmt = stmt.where(Payment.paid_at >= start)
-    if end:
-        stmt = stmt.where(Payment.paid_at <= end)
-    res = await db.execute(stmt)
-    payments = res.scalars().all()
-    total = sum([float(p.amount) for p in payments if p.amount is not None])
+    async def compute():
+        stmt = sa_select(func.coalesce(func.sum(Payment.amount), 0), func.count(Payment.id))
+        if start:
+            stmt = stmt.where(Payment.paid_at >= start)
+        if end:
+            stmt = stmt.where(Payment.paid_at <= end)
+        total, count = (await db.execute(stmt)).one()
+        return {"total": float(total), "count": count}
+
+    key = f"rep:revenue:{start.isoformat() if start else ''}:{end.isoformat() if end else ''}"
+    report = await cached_report(key, compute)
     # audit
-    async with db.begin():
-        await log_audit(db, actor_id=current_user.id, action="generate_revenue_report", object_type="report", object_id="revenue", detail={"start": start.isoformat() if start else None, "end": end.isoformat() if end else None})
-    return {"total": total, "count": len(payments)}
+    await enqueue_audit(actor_id=current_user.id, action="generate_revenue_report", object_type="report", object_id="revenue", detail={"start": start.isoformat() if start else None, "end": end.isoformat() if end else None})
+    return report
 
 
 @router.get("/reports/reconciliation", dependencies=[Depends(role_required(["Admin"]))])
-async def reconciliation_report(db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
-    # Simple reconciliation: list payments without booking or bookings without successful payments
-    stmt_p = sa_select(Payment).where((Payment.booking_id == None) | (Payment.status != 'initiated'))
-    res_p = await db.execute(stmt_p)
-    payments = res_p.scalars().all()
-
-    stmt_b = sa_select(Booking)
-    res_b = await db.execute(stmt_b)
-    bookings = res_b.scalars().all()
-    unpaid = [b for b in bookings if b.id and not any((p.booking_id == b.id and (p.status or '').lower() in ('success','successful','paid','completed')) for p in payments)]
-
-    async with db.begin():
-        await log_audit(db, actor_id=current_user.id, action="generate_reconciliation_report", object_type="report", object_id="reconciliation", detail={})
-
-    return {"payments_unlinked_count": len([p for p in payments if not p.booking_id]), "bookings_unpaid_count": len(unpaid)}
+async def reconciliation_report(current_user=Depends(get_current_user)):
+    # Simple reconciliation: count payments without booking and bookings without a successful payment
+    async def compute():
+        unlinked_q = sa_select(func.count()).select_from(Payment).where(Payment.booking_id.is_(None))
+        paid_q = sa_select(Payment.id).where(
+            Payment.booking_id == Booking.id,
+            func.lower(Payment.status).in_(PAYMENT_SUCCESS_STATUSES),
+        )
+        unpaid_q = sa_select(func.count()).select_from(Booking).where(~paid_q.exists())
+        # independent counts: run them side by side on two pooled connections
+        async with async_session() as s1, async_session() as s2:
+            unlinked_res, unpaid_res = await asyncio.gather(s1.execute(unlinked_q), s2.execute(unpaid_q))
+        unlinked = unlinked_res.scalar_one()
+        unpaid = unpaid_res.scalar_one()
+        return {"payments_unlinked_count": unlinked, "bookings_unpaid_count": unpaid}
+
+    # the version moves on every payment webhook, so a cached result is never stale;
+    # without Redis there is no version to key on, so compute uncached
+    version = await report_version()
+    if version is None:
+        report = await compute()
+    else:
+        report = await cached_report(f"rep:reconciliation:{version}", compute)
+
+    await enqueue_audit(actor_id=current_user.id, action="generate_reconciliation_report", object_type="report", object_id="reconciliation", detail={})
+
+    return report
 
@@ -12,6 +12,15 @@ from app.config import settings
 
 router = APIRouter(tags=["auth"])
 
+# count a failed login and start the window on the first failure, in one round-trip
+_RECORD_LOGIN_FAILURE = redis_client.register_script(
+    """
+    local c = redis.call('INCR', KEYS[1])
+    if c == 1 then redis.call('EXPIRE', KEYS[1], ARGV[1]) end
+    return c
+    """
+)
+
 
 class RegisterIn(BaseModel):
     email: EmailStr
@@ -34,7 +43,7 @@ async def register(payload: RegisterIn, db: AsyncSession = Depends(get_session))
     existing = res.scalars().first()
     if existing:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
-    hashed = auth_service.hash_password(payload.password)
+    hashed = await auth_service.hash_password(payload.password)
     user = User(email=payload.email, full_name=payload.full_name, phone=payload.phone, hashed_password=hashed)
     if payload.role:
         user.role = payload.role
@@ -55,11 +64,15 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     stmt = sa_select(User).where(User.email == identifier)
     res = await db.execute(stmt)
     user = res.scalars().first()
-    if not user or not auth_service.verify_password(form_data.password, user.hashed_password):
+    valid, new_hash = await auth_service.verify_password(form_data.password, user.hashed_password) if user else (False, None)
+    if not valid:
         # increment attempts
-        await redis_client.incr(rl_key)
-        await redis_client.expire(rl_key, settings.LOGIN_RATE_LIMIT_WINDOW_SECONDS)
+        await _RECORD_LOGIN_FAILURE(keys=[rl_key], args=[settings.LOGIN_RATE_LIMIT_WINDOW_SECONDS])
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    if new_hash:
+        # legacy bcrypt (or outdated argon2 parameters): store the upgraded hash
+        user.hashed_password = new_hash
+        await db.commit()
 
     # successful login: clear attempts
     await redis_client.delete(rl_key)
@@ -91,11 +104,12 @@ class LogoutIn(BaseModel):
 @router.post("/logout", status_code=204)
 async def logout(payload: LogoutIn):
     try:
-        _, jti = await auth_service.verify_refresh_token(payload.refresh_token)
+        user_id, jti = await auth_service.verify_refresh_token(payload.refresh_token)
     except Exception:
         # already invalid / revoked
         return None
     await auth_service.revoke_refresh_token(jti)
+    await auth_service.invalidate_principal(user_id)
     return None
 from fastapi import APIRouter
 
@@ -1,18 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from redis.exceptions import RedisError
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy import literal
 from sqlalchemy import update as sa_update
 from sqlalchemy import select as sa_select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
+from typing import Optional
 
 from app.schemas.booking import (
     LockSeatRequest,
     LockSeatResponse,
     ConfirmBookingRequest,
+    AtomicBookRequest,
     BookingResponse,
     ReleaseLockRequest,
 )
-from app.services.seat_lock import lock_seat, validate_and_consume_lock, release_lock
+from app.services.seat_lock import lock_seat, validate_and_consume_lock, release_lock, lock_and_consume
 from app.db.session import get_session
 import app.models.models as models
 
@@ -40,44 +45,79 @@ async def confirm_booking(req: ConfirmBookingRequest, db: AsyncSession = Depends
     ok = await validate_and_consume_lock(req.trip_id, req.seat_id, req.token)
     if not ok:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Invalid or expired lock token")
+    return await _book_seat(db, req.trip_id, req.seat_id, req.user_id)
 
-    # perform transactional booking; rely on DB unique constraint to avoid double-booking
-    booking = models.Booking(
-        user_id=req.user_id,
-        trip_id=req.trip_id,
-        seat_id=req.seat_id,
-        status="confirmed",
-        total_amount=0,
+
+@router.post("/locks/atomic_book", response_model=BookingResponse)
+async def atomic_book(req: AtomicBookRequest, db: AsyncSession = Depends(get_session)):
+    """Lock and book a seat in one call, for clients that don't hold the lock across requests."""
+    try:
+        ok = await lock_and_consume(req.trip_id, req.seat_id)
+    except RedisError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Seat locking unavailable")
+    if not ok:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Seat already locked")
+    return await _book_seat(db, req.trip_id, req.seat_id, req.user_id)
+
+
+async def _book_seat(db: AsyncSession, trip_id: int, seat_id: int, user_id: Optional[int]) -> BookingResponse:
+    # book the seat and take it off the trip in one statement (one round-trip):
+    #   booked: insert unless the trip is full; ON CONFLICT on (trip_id, seat_id) covers double-booking
+    #   taken:  decrement seats_available only if the insert went through
+    # the outer select always yields one row so the outcome can be told apart without exceptions
+    Booking, Trip = models.Booking, models.Trip
+    values = {
+        Booking.user_id: user_id,
+        Booking.trip_id: trip_id,
+        Booking.seat_id: seat_id,
+        Booking.status: "confirmed",
+        Booking.total_amount: 0,
+    }
+    has_seats = sa_select(Trip.id).where(Trip.id == trip_id, Trip.seats_available > 0).exists()
+    booked = (
+        pg_insert(Booking)
+        .from_select(
+            [col.key for col in values],
+            sa_select(*(literal(value, col.type) for col, value in values.items())).where(has_seats),
+        )
+        .on_conflict_do_nothing(index_elements=[Booking.trip_id, Booking.seat_id])
+        .returning(Booking.id, Booking.booked_at)
+        .cte("booked")
+    )
+    taken = (
+        sa_update(Trip)
+        .where(Trip.id == trip_id, Trip.seats_available > 0, sa_select(booked.c.id).exists())
+        .values(seats_available=Trip.seats_available - 1)
+        .returning(Trip.id)
+        .cte("taken")
+    )
+    stmt = sa_select(
+        sa_select(booked.c.id).scalar_subquery().label("id"),
+        sa_select(booked.c.booked_at).scalar_subquery().label("booked_at"),
+        sa_select(taken.c.id).exists().label("taken"),
+        has_seats.label("had_seats"),
     )
 
     try:
         async with db.begin():
-            # decrement seats_available atomically if > 0
-            upd = (
-                sa_update(models.Trip)
-                .where(models.Trip.id == req.trip_id)
-                .where(models.Trip.seats_available > 0)
-                .values(seats_available=(models.Trip.seats_available - 1))
-            )
-            result = await db.execute(upd)
-            if result.rowcount == 0:
-                # no seats available, rollback
+            booking = (await db.execute(stmt)).one()
+            if booking.id is not None and not booking.taken:
+                # the last seat went to a concurrent booking after our snapshot; undo the insert
                 raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="No seats available")
-
-            db.add(booking)
-
         # committed
     except IntegrityError:
-        # violation of unique constraint (trip+seat) => already booked
+        # FK violations (unknown user/seat) surface here
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Seat already booked")
 
-    await db.refresh(booking)
+    if booking.id is None:
+        detail = "Seat already booked" if booking.had_seats else "No seats available"
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail)
 
     return BookingResponse(
         booking_id=booking.id,
-        trip_id=booking.trip_id,
-        seat_id=booking.seat_id,
-        status=booking.status,
+        trip_id=trip_id,
+        seat_id=seat_id,
+        status="confirmed",
         booked_at=booking.booked_at,
     )
 
@@ -1,16 +1,22 @@
+import orjson
 from fastapi import APIRouter, Request, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import get_session
 from app.schemas.payment import PaymentInitiateRequest, PaymentInitiateResponse, WebhookAck
-from app.services.payment_gateway import get_adapter, mark_event_processed, is_event_processed
+from app.services.payment_gateway import get_adapter, mark_event_processed
+from app.services.seat_lock import release_lock
+from app.services.report_cache import bump_report_version
 from app.metrics import PAYMENT_SUCCESS, PAYMENT_FAILURE
-from app.models.models import Payment, Booking
+from app.models.models import Payment, Booking, Trip
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import select as sa_select
+from sqlalchemy import insert as sa_insert, literal, select as sa_select, update as sa_update
 from datetime import datetime
 
 router = APIRouter()
 
+PAYMENT_SUCCESS_STATUSES = ("successful", "success", "paid", "completed")
+PAYMENT_FAILED_STATUSES = ("failed", "failed_attempt", "error", "declined", "cancelled")
+
 
 @router.get("/")
 async def payments_root():
@@ -19,7 +25,7 @@ async def payments_root():
 
 @router.post("/initiate", response_model=PaymentInitiateResponse)
 async def initiate_payment(req: PaymentInitiateRequest, db: AsyncSession = Depends(get_session)):
-    adapter = await get_adapter(req.provider)
+    adapter = get_adapter(req.provider)
     # create a Payment record with status initiated
     provider_resp = await adapter.initiate(req.booking_id, req.amount, req.currency)
     provider_ref = provider_resp.get("provider_ref")
@@ -46,16 +52,16 @@ async def payment_webhook(provider: str, request: Request, db: AsyncSession = De
     body = await request.body()
     headers = {k.lower(): v for k, v in request.headers.items()}
 
-    adapter = await get_adapter(provider)
+    adapter = get_adapter(provider)
 
     # verify signature
     valid = await adapter.verify_signature(headers, body)
     if not valid:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid signature")
 
-    # parse event
+    # parse event from the bytes already read for the signature check
     try:
-        payload = await request.json()
+        payload = orjson.loads(body)
     except Exception:
         payload = {}
 
@@ -68,11 +74,6 @@ async def payment_webhook(provider: str, request: Request, db: AsyncSession = De
         # cannot deduplicate without id
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing event id for idempotency")
 
-    # check idempotency/replay
-    processed = await is_event_processed(provider, str(event_id))
-    if processed:
-        return WebhookAck(received=True)
-
     # basic normalization for common providers
     status_str = None
     provider_ref = None
@@ -89,79 +90,89 @@ async def payment_webhook(provider: str, request: Request, db: AsyncSession = De
         provider_ref = data.get("transaction_id") or data.get("tx_ref")
         amount = data.get("amount")
 
-    # mark event as being processed (idempotency store)
+    # idempotency/replay: SET NX both checks and claims the event in one round-trip
     added = await mark_event_processed(provider, str(event_id))
     if not added:
-        # race: someone else processed
+        # already processed (or being processed by a concurrent delivery)
         return WebhookAck(received=True)
 
-    # transactional update: create/update Payment and update Booking state
+    # normalize status checks
+    lcstatus = (status_str or '').lower()
+    if lcstatus in PAYMENT_SUCCESS_STATUSES:
+        booking_status = "paid"
+    elif lcstatus in PAYMENT_FAILED_STATUSES:
+        booking_status = "cancelled"
+    else:
+        booking_status = None
+
+    # update (or create) the payment, move its booking to the new status and, on failure,
+    # give the seat back to the trip -- all in one statement, so one round-trip.
+    # An event without a provider ref must not match the NULL-ref payments (`= NULL` would
+    # compile to IS NULL and update every one of them); it only ever takes the insert branch.
+    pay = (
+        sa_update(Payment)
+        .where(Payment.provider_ref == provider_ref, Payment.provider_ref.isnot(None))
+        .values(status=status_str or Payment.status)
+        .returning(Payment.booking_id)
+        .cte("pay")
+    )
+    new_values = {
+        Payment.booking_id: None,
+        Payment.amount: amount or 0,
+        Payment.provider: provider,
+        Payment.provider_ref: provider_ref,
+        Payment.status: status_str or 'unknown',
+    }
+    new_pay = (
+        sa_insert(Payment)
+        .from_select(
+            [col.key for col in new_values],
+            sa_select(*(literal(value, col.type) for col, value in new_values.items())).where(
+                ~sa_select(pay.c.booking_id).exists()
+            ),
+        )
+        .cte("new_pay")
+    )
+
+    if booking_status is None:
+        stmt = sa_select(pay.c.booking_id).add_cte(new_pay)
+    else:
+        booking = (
+            sa_update(Booking)
+            .where(Booking.id == pay.c.booking_id, Booking.status != booking_status)
+            .values(status=booking_status)
+            .returning(Booking.trip_id, Booking.seat_id)
+            .cte("booking")
+        )
+        stmt = sa_select(booking.c.trip_id, booking.c.seat_id).add_cte(new_pay)
+        if booking_status == "cancelled":
+            release = (
+                sa_update(Trip)
+                .where(Trip.id == booking.c.trip_id)
+                .values(seats_available=Trip.seats_available + 1)
+                .cte("release")
+            )
+            stmt = stmt.add_cte(release)
+
     try:
         async with db.begin():
-            # try to locate payment by provider_ref
-            stmt = sa_select(Payment).where(Payment.provider_ref == provider_ref)
-            res = await db.execute(stmt)
-            pay = res.scalars().first()
-            if not pay:
-                pay = Payment(
-                    booking_id=None,
-                    amount=amount or 0,
-                    currency=getattr(Payment, 'currency', 'UGX'),
-                    provider=provider,
-                    provider_ref=provider_ref,
-                    status=status_str or 'unknown',
-                )
-                db.add(pay)
-            else:
-                pay.status = status_str or pay.status
-
-            # normalize status checks
-            lcstatus = (status_str or '').lower()
-
-            # if payment succeeded, mark booking as paid
-            if lcstatus in ("successful", "success", "paid", "completed"):
-                # find booking via payment.booking_id
-                booking = None
-                if pay.booking_id:
-                    stmt_b = sa_select(Booking).where(Booking.id == pay.booking_id)
-                    resb = await db.execute(stmt_b)
-                    booking = resb.scalars().first()
-
-                if booking:
-                    booking.status = "paid"
-                PAYMENT_SUCCESS.labels(provider=provider).inc()
-
-            # if payment failed, cancel booking and release seat
-            elif lcstatus in ("failed", "failed_attempt", "error", "declined", "cancelled"):
-                booking = None
-                if pay.booking_id:
-                    stmt_b = sa_select(Booking).where(Booking.id == pay.booking_id)
-                    resb = await db.execute(stmt_b)
-                    booking = resb.scalars().first()
-
-                if booking:
-                    # mark booking cancelled
-                    booking.status = "cancelled"
-                    # increment seats_available on trip
-                    if booking.trip_id:
-                        upd = sa_update(Booking.__table__.metadata.tables['trips']).where(Booking.__table__.metadata.tables['trips'].c.id == booking.trip_id).values(seats_available=(Booking.__table__.metadata.tables['trips'].c.seats_available + 1))
-                        # execute raw update
-                        await db.execute(upd)
-                    # attempt to release any lock (best-effort)
-                    try:
-                        from app.services.seat_lock import release_lock
-
-                        await release_lock(booking.trip_id, booking.seat_id, token=None)
-                    except Exception:
-                        pass
-                PAYMENT_FAILURE.labels(provider=provider).inc()
-            else:
-                # unknown/transient statuses: increment failure metric for observability
-                PAYMENT_FAILURE.labels(provider=provider).inc()
-                # Optionally: create ticket here
-
+            row = (await db.execute(stmt)).first()
     except Exception as exc:
         # Rollback handled by context manager; ensure event key is cleared? Keep it to avoid replayers causing repeated DB errors.
         raise HTTPException(status_code=500, detail=str(exc))
+    await bump_report_version()
+
+    if booking_status == "paid":
+        PAYMENT_SUCCESS.labels(provider=provider).inc()
+    else:
+        # failed payments, plus unknown/transient statuses for observability
+        PAYMENT_FAILURE.labels(provider=provider).inc()
+
+    if booking_status == "cancelled" and row is not None:
+        # attempt to release any lock (best-effort)
+        try:
+            await release_lock(row.trip_id, row.seat_id, token=None)
+        except Exception:
+            pass
 
     return WebhookAck(received=True)
@@ -1,40 +1,159 @@
-from app.celery_app import celery_app
+import secrets
+import time
+
+import orjson
+from celery.signals import worker_process_init
+
+from app.celery_app import celery_app, run_async
 from celery.utils.log import get_task_logger
-from app.services.notification_service import notification_service, NOTIF_COUNTER_RETRIED
+from app.services.notification_service import NotificationService, NOTIF_COUNTER_RETRIED
 from app.services.notification_providers import LogProvider
 from app.redis_client import redis_client
-import asyncio
 
 logger = get_task_logger(__name__)
 
 DLQ_KEY = "notification_dlq"
+DLQ_DRAIN_BATCH_SIZE = 100
+# a drain parks its batch in notification_dlq:processing:<token> until every message is
+# published; the zset maps each in-flight token to when it was claimed
+DLQ_PROCESSING_KEY = "notification_dlq:processing"
+# a claimed batch not published within this long (drainer killed) goes back on the DLQ
+DLQ_PROCESSING_TIMEOUT_SECONDS = 300
+# entries that can't be decoded into task kwargs; kept for inspection, never resubmitted
+DLQ_POISON_KEY = "notification_dlq:poison"
+
+# RPUSH puts new messages at the tail, so the oldest sit at the head: move the oldest
+# ARGV[1] into this drain's processing list and register it, all atomically
+_claim_dlq_batch = redis_client.register_script("""
+local messages = redis.call('lrange', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #messages == 0 then
+  return messages
+end
+redis.call('ltrim', KEYS[1], tonumber(ARGV[1]), -1)
+redis.call('rpush', KEYS[2], unpack(messages))
+redis.call('zadd', KEYS[3], ARGV[3], ARGV[2])
+return messages
+""")
+
+# put every batch claimed before ARGV[1] back at the head of the DLQ, in its original order;
+# returns the number of messages requeued
+_requeue_stale_dlq_batches = redis_client.register_script("""
+local requeued = 0
+for _, token in ipairs(redis.call('zrangebyscore', KEYS[2], '-inf', ARGV[1])) do
+  local key = ARGV[2] .. token
+  local messages = redis.call('lrange', key, 0, -1)
+  for i = #messages, 1, -1 do
+    redis.call('lpush', KEYS[1], messages[i])
+  end
+  requeued = requeued + #messages
+  redis.call('del', key)
+  redis.call('zrem', KEYS[2], token)
+end
+return requeued
+""")
+
+# one service per provider, shared by all tasks in the process; tasks never mutate them
+_SERVICES = {
+    "log": NotificationService(LogProvider()),
+}
+
+
+@worker_process_init.connect
+def _warm_templates(**_kwargs):
+    # templates are rendered here, in the workers; compile them before the first task
+    _SERVICES["log"].warmup()
+
+
+def _service_for(provider_name: str) -> NotificationService:
+    # only the log provider exists in this scaffold; unknown names fall back to it
+    return _SERVICES.get(provider_name) or _SERVICES["log"]
 
 
 @celery_app.task(bind=True, autoretry_for=(Exception,), retry_backoff=True, retry_backoff_max=600, retry_jitter=True, max_retries=3)
 def send_notification_task(self, channel: str, to: str, template_name: str, context: dict = None, locale: str = "en", provider_name: str = "log"):
     """Channel: 'email' or 'sms'. This task retries on failure; when retries exhausted it writes to DLQ in Redis."""
-    # NOTE: Celery tasks are synchronous by default here; run async calls via asyncio
-    async def _do():
-        # provider selection (we only have LogProvider in this scaffold)
-        provider = LogProvider()
-        # temporary: create a NotificationService that uses provider instance
-        svc = notification_service
-        svc.provider = provider
+    # NOTE: Celery tasks are synchronous; async calls run on the worker's persistent loop
+    svc = _service_for(provider_name)
 
+    async def _do():
         if channel == "email":
             await svc.send_email(to=to, subject=context.get('subject',''), template_name=template_name, context=context, locale=locale)
         else:
             await svc.send_sms(to=to, template_name=template_name, context=context, locale=locale)
 
     try:
-        asyncio.get_event_loop().run_until_complete(_do())
-    except self.MaxRetriesExceededError:
-        # move to DLQ
-        logger.error("Max retries exceeded for notification to %s; sending to DLQ", to)
-        redis_client.rpush(DLQ_KEY, str({"channel": channel, "to": to, "template": template_name, "context": context, "locale": locale}))
-        raise
+        run_async(_do())
     except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            # retry() would just re-raise exc here, so move to the DLQ ourselves; the payload is
+            # the task's own kwargs as JSON so drain_notification_dlq can resubmit it verbatim
+            logger.error("Max retries exceeded for notification to %s; sending to DLQ", to)
+            payload = {"channel": channel, "to": to, "template_name": template_name, "context": context, "locale": locale, "provider_name": provider_name}
+            run_async(redis_client.rpush(DLQ_KEY, orjson.dumps(payload)))
+            raise
         # increment retry metric
         NOTIF_COUNTER_RETRIED.labels(channel=channel, provider=provider_name).inc()
         logger.exception("Error sending notification: %s", exc)
         raise self.retry(exc=exc)
+
+
+@celery_app.task
+def drain_notification_dlq(batch_size: int = DLQ_DRAIN_BATCH_SIZE):
+    """Resubmit up to `batch_size` dead-lettered notifications, oldest first. Run on demand
+    once the provider has recovered; messages that fail again land back in the DLQ.
+
+    The batch stays in a processing list until every message is published, so a drainer
+    dying mid-batch never loses it (the next drain requeues batches older than
+    DLQ_PROCESSING_TIMEOUT_SECONDS). Entries that don't decode go to DLQ_POISON_KEY."""
+    now = time.time()
+    requeued = run_async(_requeue_stale_dlq_batches(
+        keys=[DLQ_KEY, DLQ_PROCESSING_KEY],
+        args=[now - DLQ_PROCESSING_TIMEOUT_SECONDS, f"{DLQ_PROCESSING_KEY}:"],
+    ))
+    if requeued:
+        logger.warning("Requeued %d notifications from abandoned DLQ drains", requeued)
+
+    # a processing list per drain, so concurrent drainers never resubmit the same message
+    token = secrets.token_hex(8)
+    processing_key = f"{DLQ_PROCESSING_KEY}:{token}"
+    messages = run_async(_claim_dlq_batch(
+        keys=[DLQ_KEY, processing_key, DLQ_PROCESSING_KEY],
+        args=[batch_size, token, now],
+    ))
+    if not messages:
+        return 0
+
+    published = 0
+    poison = []
+    try:
+        # one broker connection for the whole batch
+        with celery_app.producer_or_acquire() as producer:
+            for raw in messages:
+                try:
+                    kwargs = orjson.loads(raw)
+                    if not isinstance(kwargs, dict):
+                        raise TypeError(f"expected task kwargs, got {type(kwargs).__name__}")
+                except (ValueError, TypeError):
+                    logger.error("Undecodable DLQ entry moved to %s: %r", DLQ_POISON_KEY, raw)
+                    poison.append(raw)
+                else:
+                    send_notification_task.apply_async(kwargs=kwargs, producer=producer)
+                published += 1
+    except Exception:
+        # broker trouble: put what wasn't published back at the head of the DLQ, in order
+        logger.exception("DLQ drain failed after %d of %d messages; requeueing the rest", published, len(messages))
+        run_async(_settle_dlq_batch(token, processing_key, poison, messages[published:]))
+        raise
+    run_async(_settle_dlq_batch(token, processing_key, poison, []))
+    return published - len(poison)
+
+
+async def _settle_dlq_batch(token, processing_key, poison, unpublished):
+    async with redis_client.pipeline(transaction=True) as pipe:
+        if poison:
+            pipe.rpush(DLQ_POISON_KEY, *poison)
+        if unpublished:
+            pipe.lpush(DLQ_KEY, *reversed(unpublished))
+        pipe.delete(processing_key)
+        pipe.zrem(DLQ_PROCESSING_KEY, token)
+        await pipe.execute()
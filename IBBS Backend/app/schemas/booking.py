@@ -12,7 +12,7 @@ class LockSeatRequest(BaseModel):
 
 class LockSeatResponse(BaseModel):
     token: str
-    expires_at: datetime
+    expires_at: datetime  # built from epoch seconds; serialized as an ISO timestamp (UTC)
 
 
 class ConfirmBookingRequest(BaseModel):
@@ -22,6 +22,12 @@ class ConfirmBookingRequest(BaseModel):
     user_id: Optional[int] = None
 
 
+class AtomicBookRequest(BaseModel):
+    trip_id: int
+    seat_id: int
+    user_id: Optional[int] = None
+
+
 class ReleaseLockRequest(BaseModel):
     trip_id: int
     seat_id: int
@@ -1,17 +1,45 @@
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.models import AuditLog
-from datetime import datetime
-
-
-async def log_audit(db: AsyncSession, actor_id: int, action: str, object_type: str = None, object_id: str = None, detail: dict = None, ip_address: str = None):
-    audit = AuditLog(
-        actor_id=actor_id,
-        action=action,
-        object_type=object_type,
-        object_id=object_id,
-        detail=detail,
-        ip_address=ip_address,
-    )
-    db.add(audit)
-    # do not commit here; caller should include in transaction context
-    return audit
+import logging
+
+import orjson
+from app.redis_client import redis_client
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_KEY = "audit:queue"
+# a flush parks its batch in audit:processing:<token> until the INSERT commits; the zset maps
+# each in-flight token to when it was claimed so abandoned batches can be requeued
+AUDIT_PROCESSING_KEY = "audit:processing"
+# events the database rejects on their own (see app.tasks.flush_audit_queue), kept for inspection
+AUDIT_DLQ_KEY = "audit:dlq"
+
+
+async def enqueue_audit(actor_id: int, action: str, object_type: str = None, object_id: str = None, detail: dict = None, ip_address: str = None):
+    """Queue an audit event in Redis; app.tasks.flush_audit_queue writes queued events in batches.
+
+    Call after the audited change has committed. A Redis failure is logged rather than
+    raised so it never fails a request whose change is already durable.
+    """
+    event = {
+        "actor_id": actor_id,
+        "action": action,
+        "object_type": object_type,
+        "object_id": object_id,
+        "detail": detail,
+        "ip_address": ip_address,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        await redis_client.lpush(AUDIT_QUEUE_KEY, orjson.dumps(event))
+    except Exception:
+        logger.exception("Failed to enqueue audit event %s", action)
+
+
+def audit_rows(events):
+    """Decode queued audit events into AuditLog insert rows."""
+    rows = []
+    for raw in events:
+        event = orjson.loads(raw)
+        event["created_at"] = datetime.fromisoformat(event["created_at"])
+        rows.append(event)
+    return rows
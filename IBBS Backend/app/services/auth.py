@@ -1,73 +1,112 @@
+import asyncio
+import logging
+import os
+import time
 import uuid
-from datetime import datetime, timedelta
-from typing import Tuple
-
-from jose import JWTError, jwt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Final, Optional, Tuple
+
+import jwt
+import orjson
+from cachetools import TLRUCache, TTLCache
+from jwt import InvalidTokenError, PyJWTError
+from jwt.algorithms import get_default_algorithms
+from jwt.utils import base64url_encode
 from passlib.context import CryptContext
 
 from app.config import settings
 from app.redis_client import redis_client
 
+logger = logging.getLogger(__name__)
+
+# argon2id for new hashes; existing bcrypt hashes still verify and are upgraded on login
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1,
+)
+
+# hashing is CPU-bound and releases the GIL; keep it off the event loop
+_hash_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="pwhash")
+
+ALGORITHM: Final[str] = settings.JWT_ALGORITHM
+SECRET_KEY: Final[str] = settings.SECRET_KEY
+ACCESS_TOKEN_TTL_SECONDS: Final[int] = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+REFRESH_TOKEN_TTL_SECONDS: Final[int] = settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# tokens are minted on every login/refresh: resolve the signer, its key and the
+# (constant) encoded header once instead of inside jwt.encode on each call
+_SIGNER = get_default_algorithms()[ALGORITHM]
+_SIGNING_KEY = _SIGNER.prepare_key(SECRET_KEY)
+_HEADER_B64: Final[bytes] = base64url_encode(orjson.dumps({"alg": ALGORITHM, "typ": "JWT"}))
 
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, pwd_context.hash, password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Return (valid, new_hash); new_hash is set when the stored hash should be upgraded."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_pool, pwd_context.verify_and_update, plain_password, hashed_password
+    )
 
 
-def _now() -> datetime:
-    return datetime.utcnow()
+def _encode(payload: dict) -> str:
+    signing_input = _HEADER_B64 + b"." + base64url_encode(orjson.dumps(payload))
+    signature = base64url_encode(_SIGNER.sign(signing_input, _SIGNING_KEY))
+    return (signing_input + b"." + signature).decode()
 
 
 def create_access_token(user_id: int) -> str:
-    expire = _now() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    payload = {"sub": str(user_id), "type": "access", "exp": int(expire.timestamp())}
-    token = jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
-    return token
+    payload = {"sub": str(user_id), "type": "access", "exp": int(time.time()) + ACCESS_TOKEN_TTL_SECONDS}
+    return _encode(payload)
 
 
 async def create_refresh_token(user_id: int) -> Tuple[str, str]:
     # jti used for rotation and revocation
     jti = uuid.uuid4().hex
-    expire = _now() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    payload = {"sub": str(user_id), "type": "refresh", "jti": jti, "exp": int(expire.timestamp())}
-    token = jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    payload = {"sub": str(user_id), "type": "refresh", "jti": jti, "exp": int(time.time()) + REFRESH_TOKEN_TTL_SECONDS}
+    token = _encode(payload)
     # store jti in redis with expiry
     key = f"refresh:{jti}"
-    await redis_client.set(key, str(user_id), ex=int((expire - _now()).total_seconds()))
+    await redis_client.set(key, str(user_id), ex=REFRESH_TOKEN_TTL_SECONDS)
     return token, jti
 
 
 def _decode_token(token: str) -> dict:
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
-    except JWTError:
+    except PyJWTError:
         raise
 
 
-def verify_access_token(token: str) -> int:
+def decode_access_token(token: str) -> Tuple[int, int]:
+    """Return (user_id, exp) for a valid access token."""
     payload = _decode_token(token)
     if payload.get("type") != "access":
-        raise JWTError("Invalid token type")
-    return int(payload.get("sub"))
+        raise InvalidTokenError("Invalid token type")
+    return int(payload.get("sub")), int(payload.get("exp"))
+
+
+def verify_access_token(token: str) -> int:
+    return decode_access_token(token)[0]
 
 
 async def verify_refresh_token(token: str) -> Tuple[int, str]:
     payload = _decode_token(token)
     if payload.get("type") != "refresh":
-        raise JWTError("Invalid token type")
+        raise InvalidTokenError("Invalid token type")
     user_id = int(payload.get("sub"))
     jti = payload.get("jti")
     key = f"refresh:{jti}"
     val = await redis_client.get(key)
     if not val or int(val) != user_id:
-        raise JWTError("Refresh token revoked or not found")
+        raise InvalidTokenError("Refresh token revoked or not found")
     return user_id, jti
 
 
@@ -82,3 +121,76 @@ async def rotate_refresh_token(old_jti: str, user_id: int) -> Tuple[str, str]:
 async def revoke_refresh_token(jti: str):
     key = f"refresh:{jti}"
     await redis_client.delete(key)
+
+
+# Authenticated-principal cache: the User columns request handlers rely on, shared by all
+# API processes so a valid token costs no SELECT. Lives as long as an access token.
+PRINCIPAL_KEY_TPL = "u:{user_id}"
+PRINCIPAL_FIELDS = ("id", "email", "full_name", "role", "is_active", "is_superuser")
+
+
+async def get_cached_principal(user_id: int) -> Optional[Dict]:
+    try:
+        raw = await redis_client.get(PRINCIPAL_KEY_TPL.format(user_id=user_id))
+    except Exception:
+        logger.warning("Principal cache read failed for user %s", user_id, exc_info=True)
+        return None
+    return orjson.loads(raw) if raw else None
+
+
+async def cache_principal(user) -> Dict:
+    """Store the user's principal columns in Redis and return them."""
+    principal = {field: getattr(user, field) for field in PRINCIPAL_FIELDS}
+    try:
+        await redis_client.set(
+            PRINCIPAL_KEY_TPL.format(user_id=user.id),
+            orjson.dumps(principal),
+            ex=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        )
+    except Exception:
+        logger.warning("Principal cache write failed for user %s", user.id, exc_info=True)
+    return principal
+
+
+# In-process caches in front of the Redis principal cache, so steady-state requests do no IO
+# for auth at all. Invalidations are broadcast to every API process over AUTH_INVALIDATE_CHANNEL.
+TOKEN_CACHE_TTL_SECONDS = 60
+USER_CACHE_TTL_SECONDS = 60
+AUTH_INVALIDATE_CHANNEL = "auth:invalidate"
+
+# access token -> (user_id, exp); an entry never outlives the token's own expiry
+token_cache = TLRUCache(
+    maxsize=10_000,
+    ttu=lambda _token, value, now: min(now + TOKEN_CACHE_TTL_SECONDS, value[1]),
+    timer=time.time,
+)
+# user_id -> User
+user_cache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL_SECONDS)
+
+
+def evict_cached_user(user_id: int) -> None:
+    user_cache.pop(user_id, None)
+
+
+async def invalidate_principal(user_id: int) -> None:
+    """Drop the user's cached principal everywhere: Redis, this process and its peers."""
+    evict_cached_user(user_id)
+    await redis_client.delete(PRINCIPAL_KEY_TPL.format(user_id=user_id))
+    await redis_client.publish(AUTH_INVALIDATE_CHANNEL, user_id)
+
+
+async def listen_for_invalidations() -> None:
+    """Evict users named on AUTH_INVALIDATE_CHANNEL; runs for the life of the process."""
+    while True:
+        try:
+            async with redis_client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                await pubsub.subscribe(AUTH_INVALIDATE_CHANNEL)
+                async for message in pubsub.listen():
+                    evict_cached_user(int(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # the TTLs still bound staleness while we reconnect
+            logger.warning("Auth invalidation listener failed; reconnecting", exc_info=True)
+            user_cache.clear()
+            await asyncio.sleep(1)
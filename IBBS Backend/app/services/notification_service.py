@@ -1,8 +1,9 @@
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, TemplateNotFound, select_autoescape
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple, Union
 from app.services.notification_providers import LogProvider, NotificationProvider
 from app.redis_client import redis_client
+from app.config import settings
 from datetime import datetime
 from prometheus_client import Counter
 import logging
@@ -11,41 +12,75 @@ logger = logging.getLogger(__name__)
 
 TEMPLATES_DIR = Path(__file__).resolve().parents[1] / "notifications" / "templates"
 
+# Workers load compiled template code from the bytecode cache instead of re-parsing sources;
+# outside DEBUG templates are not re-stat'ed on every lookup either. The cache files are
+# executed, so let Jinja pick its default directory: a private per-user one it creates 0700
+# and refuses to use if another user owns it.
 _env = Environment(
     loader=FileSystemLoader(str(TEMPLATES_DIR)),
     autoescape=select_autoescape(["html", "xml", "txt"]),
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=settings.DEBUG,
 )
 
+# (locale, template_name) -> resolved template, or _MISSING when neither the locale nor the
+# en fallback has it; templates ship with the code, so a resolution holds for the process
+_MISSING = object()
+_TPL_CACHE: Dict[Tuple[str, str], Union[Template, object]] = {}
+
 # metrics
 NOTIF_COUNTER_SENT = Counter("ibbs_notifications_sent_total", "Total notifications sent", ["channel", "provider"])
 NOTIF_COUNTER_FAILED = Counter("ibbs_notifications_failed_total", "Total notification failures", ["channel", "provider"])
 NOTIF_COUNTER_RETRIED = Counter("ibbs_notifications_retried_total", "Total notification retries", ["channel", "provider"])
 
 
+def _resolve(locale: str, template_name: str) -> Union[Template, object]:
+    # try locale-specific template, fallback to en
+    try:
+        template = _env.select_template([f"{locale}/{template_name}", f"en/{template_name}"])
+    except TemplateNotFound:
+        template = _MISSING
+    _TPL_CACHE[(locale, template_name)] = template
+    return template
+
+
 class NotificationService:
     def __init__(self, provider: Optional[NotificationProvider] = None):
         self.provider = provider or LogProvider()
+        # bind the per-provider metric children once instead of resolving labels on every send
+        self._provider_label = type(self.provider).__name__
+        self._m_email_sent = NOTIF_COUNTER_SENT.labels(channel="email", provider=self._provider_label)
+        self._m_email_failed = NOTIF_COUNTER_FAILED.labels(channel="email", provider=self._provider_label)
+        self._m_sms_sent = NOTIF_COUNTER_SENT.labels(channel="sms", provider=self._provider_label)
+        self._m_sms_failed = NOTIF_COUNTER_FAILED.labels(channel="sms", provider=self._provider_label)
+
+    def warmup(self) -> int:
+        """Compile every template for every locale up front, so no send pays for it."""
+        pairs = {tuple(name.split("/", 1)) for name in _env.list_templates() if "/" in name}
+        locales = {locale for locale, _ in pairs}
+        names = {name for _, name in pairs}
+        for locale in locales:
+            for name in names:
+                _resolve(locale, name)
+        return len(_TPL_CACHE)
 
     def render(self, template_name: str, locale: str = "en", context: Dict = None) -> str:
         ctx = context or {}
-        # try locale-specific template, fallback to en
-        tpl_candidates = [f"{locale}/{template_name}", f"en/{template_name}"]
-        for tpl in tpl_candidates:
-            try:
-                template = _env.get_template(tpl)
-                return template.render(**ctx)
-            except Exception:
-                continue
-        raise RuntimeError("Template not found: %s" % template_name)
+        template = _TPL_CACHE.get((locale, template_name))
+        if template is None:
+            template = _resolve(locale, template_name)
+        if template is _MISSING:
+            raise RuntimeError("Template not found: %s" % template_name)
+        return template.render(**ctx)
 
     async def send_email(self, to: str, subject: str, template_name: str, context: Dict = None, locale: str = "en", meta: Dict = None):
         body = self.render(template_name, locale=locale, context=context)
         try:
             res = await self.provider.send_email(to=to, subject=subject, body=body, meta=meta)
-            NOTIF_COUNTER_SENT.labels(channel="email", provider=getattr(self.provider, '__class__').__name__).inc()
+            self._m_email_sent.inc()
             return res
         except Exception as exc:
-            NOTIF_COUNTER_FAILED.labels(channel="email", provider=getattr(self.provider, '__class__').__name__).inc()
+            self._m_email_failed.inc()
             logger.exception("Email send failed")
             raise
 
@@ -53,10 +88,10 @@ class NotificationService:
         body = self.render(template_name, locale=locale, context=context)
         try:
             res = await self.provider.send_sms(to=to, body=body, meta=meta)
-            NOTIF_COUNTER_SENT.labels(channel="sms", provider=getattr(self.provider, '__class__').__name__).inc()
+            self._m_sms_sent.inc()
             return res
         except Exception as exc:
-            NOTIF_COUNTER_FAILED.labels(channel="sms", provider=getattr(self.provider, '__class__').__name__).inc()
+            self._m_sms_failed.inc()
             logger.exception("SMS send failed")
             raise
 
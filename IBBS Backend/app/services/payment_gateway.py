@@ -1,9 +1,9 @@
 import hmac
 import hashlib
 import json
+import secrets
 from typing import Dict, Optional
-from uuid import uuid4
-from urllib.parse import urlencode
+from urllib.parse import quote_plus
 
 from app.config import settings
 from app.redis_client import redis_client
@@ -16,6 +16,9 @@ class PaymentError(Exception):
 
 class BaseAdapter:
     provider_name: str = "base"
+    # HMAC keyed with the current secret; copying it skips re-deriving the key pads per webhook
+    _hmac_proto = None
+    _hmac_secret: Optional[str] = None
 
     async def initiate(self, booking_id: int, amount: float, currency: str) -> Dict:
         raise NotImplementedError()
@@ -26,8 +29,18 @@ class BaseAdapter:
         if not secret:
             return False
         sig_header = headers.get("x-signature") or headers.get("x-flutterwave-signature") or ""
-        computed = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
-        return hmac.compare_digest(computed, sig_header)
+        if secret != self._hmac_secret:
+            # first use, or the secret was rotated
+            self._hmac_proto = hmac.new(secret.encode(), b"", hashlib.sha256)
+            self._hmac_secret = secret
+        try:
+            provided = bytes.fromhex(sig_header)
+        except ValueError:
+            return False
+        h = self._hmac_proto.copy()
+        h.update(body)
+        # compare the 32 raw digest bytes rather than 64 hex characters
+        return hmac.compare_digest(h.digest(), provided)
 
     def get_secret(self) -> Optional[str]:
         return ""
@@ -41,8 +54,9 @@ class FlutterwaveAdapter(BaseAdapter):
 
     async def initiate(self, booking_id: int, amount: float, currency: str) -> Dict:
         # In production you'd call Flutterwave API. Here we simulate a checkout URL and provider_ref
-        provider_ref = f"flw_{uuid4().hex}"
-        checkout_url = f"https://flutterwave.com/pay/{provider_ref}?{urlencode({'amount': amount, 'currency': currency})}"
+        provider_ref = f"flw_{secrets.token_hex(16)}"
+        # two known fields: amount is numeric and never needs quoting
+        checkout_url = f"https://flutterwave.com/pay/{provider_ref}?amount={amount}&currency={quote_plus(currency)}"
         return {"provider": self.provider_name, "provider_ref": provider_ref, "checkout_url": checkout_url}
 
 
@@ -53,7 +67,7 @@ class MTNAdapter(BaseAdapter):
         return settings.MTN_SECRET
 
     async def initiate(self, booking_id: int, amount: float, currency: str) -> Dict:
-        provider_ref = f"mtn_{uuid4().hex}"
+        provider_ref = f"mtn_{secrets.token_hex(16)}"
         # MTN typically does a push to customer's wallet; return simulated ref
         return {"provider": self.provider_name, "provider_ref": provider_ref, "checkout_url": None}
 
@@ -65,7 +79,7 @@ class AirtelAdapter(BaseAdapter):
         return settings.AIRTEL_SECRET
 
     async def initiate(self, booking_id: int, amount: float, currency: str) -> Dict:
-        provider_ref = f"airtel_{uuid4().hex}"
+        provider_ref = f"airtel_{secrets.token_hex(16)}"
         return {"provider": self.provider_name, "provider_ref": provider_ref, "checkout_url": None}
 
 
@@ -76,23 +90,23 @@ ADAPTERS = {
 }
 
 
-async def get_adapter(name: str) -> BaseAdapter:
-    ad = ADAPTERS.get(name.lower())
+# exact-match table for the spellings callers actually send, so the common case skips .lower()
+_ADAPTERS_CI = {
+    **ADAPTERS,
+    **{k.upper(): v for k, v in ADAPTERS.items()},
+    **{k.title(): v for k, v in ADAPTERS.items()},
+}
+
+
+def get_adapter(name: str) -> BaseAdapter:
+    ad = _ADAPTERS_CI.get(name) or ADAPTERS.get(name.lower())
     if not ad:
         raise PaymentError(f"Unknown provider: {name}")
     return ad
 
 
-IDEMPOTENCY_KEY_TPL = "payment_webhook:{provider}:{event_id}"
-
-
 async def mark_event_processed(provider: str, event_id: str, ttl: int = 60 * 60 * 24) -> bool:
-    key = IDEMPOTENCY_KEY_TPL.format(provider=provider, event_id=event_id)
+    key = f"payment_webhook:{provider}:{event_id}"
     # set NX to ensure we only process once
     added = await redis_client.set(key, "1", ex=ttl, nx=True)
     return bool(added)
-
-
-async def is_event_processed(provider: str, event_id: str) -> bool:
-    key = IDEMPOTENCY_KEY_TPL.format(provider=provider, event_id=event_id)
-    return await redis_client.exists(key)
@@ -0,0 +1,88 @@
+import asyncio
+import secrets
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import orjson
+
+from app.redis_client import redis_client
+
+
+REPORT_TTL_SECONDS = 60
+REPORT_LOCK_TTL_SECONDS = 30
+REPORT_POLL_INTERVAL_SECONDS = 0.1
+# bumped whenever a booking/payment status changes; reconciliation results are keyed on it
+REPORT_VERSION_KEY = "rep:version"
+
+
+# delete the lock only if it is still ours; a holder that overran the TTL must not drop the
+# lock the next computation has since taken
+_release_report_lock = redis_client.register_script("""
+if redis.call('get', KEYS[1]) == ARGV[1] then
+  return redis.call('del', KEYS[1])
+else
+  return 0
+end
+""")
+
+
+async def report_version() -> Optional[int]:
+    """Current report version, or None if Redis is unavailable (callers then skip the cache)."""
+    try:
+        return int(await redis_client.get(REPORT_VERSION_KEY) or 0)
+    except Exception:
+        return None
+
+
+async def bump_report_version() -> None:
+    try:
+        await redis_client.incr(REPORT_VERSION_KEY)
+    except Exception:
+        # worst case a cached reconciliation lives out its TTL
+        pass
+
+
+async def cached_report(key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """Return the cached result at `key`, computing it at most once across workers.
+
+    The first caller on a miss takes `<key>:lock` (SET NX) and runs `compute`; concurrent
+    callers poll for the result instead of starting their own scan. Falls back to computing
+    directly if Redis is unavailable or the lock holder gives up without publishing a result,
+    and a Redis error after computing never discards the result."""
+    lock_key = f"{key}:lock"
+    token = secrets.token_hex(16)
+    try:
+        cached = await redis_client.get(key)
+        if cached is not None:
+            return orjson.loads(cached)
+        owner = await redis_client.set(lock_key, token, nx=True, ex=REPORT_LOCK_TTL_SECONDS)
+    except Exception:
+        return await compute()
+
+    if owner:
+        try:
+            result = await compute()
+            try:
+                await redis_client.set(key, orjson.dumps(result), ex=REPORT_TTL_SECONDS)
+            except Exception:
+                pass
+            return result
+        finally:
+            try:
+                await _release_report_lock(keys=[lock_key], args=[token])
+            except Exception:
+                # the lock's TTL frees it anyway
+                pass
+
+    deadline = time.monotonic() + REPORT_LOCK_TTL_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(REPORT_POLL_INTERVAL_SECONDS)
+        try:
+            cached, locked = await redis_client.mget(key, lock_key)
+        except Exception:
+            break
+        if cached is not None:
+            return orjson.loads(cached)
+        if locked is None:
+            break
+    return await compute()
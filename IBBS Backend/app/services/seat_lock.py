@@ -1,31 +1,48 @@
 import json
-from uuid import uuid4
-from datetime import datetime, timedelta
+import secrets
 import time
 from app.metrics import SEAT_LOCK_LATENCY, SEAT_LOCK_ATTEMPTS
 from typing import Optional
 from app.redis_client import redis_client
 
+# bound counter children for every result label, so the hot path skips .labels()
+_SL_SUCCESS = SEAT_LOCK_ATTEMPTS.labels(result="success")
+_SL_FAILED = SEAT_LOCK_ATTEMPTS.labels(result="failed")
+_SL_CONSUMED = SEAT_LOCK_ATTEMPTS.labels(result="consumed")
+_SL_INVALID = SEAT_LOCK_ATTEMPTS.labels(result="invalid")
+_SL_ERROR = SEAT_LOCK_ATTEMPTS.labels(result="error")
 
-LOCK_KEY_TPL = "seat_lock:{trip_id}:{seat_id}"
+# SET NX EX and, on success, the expiry from the server clock -- one EVALSHA round-trip
+_LOCK_SCRIPT = redis_client.register_script("""
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+  local t = redis.call('time')
+  return {1, tonumber(t[1]) + tonumber(ARGV[2])}
+else
+  return {0}
+end
+""")
 
 
 async def lock_seat(trip_id: int, seat_id: int, ttl: int = 300) -> Optional[dict]:
-    """Attempt to create a lock for a seat. Returns dict with token and expires_at on success, or None if already locked."""
-    key = LOCK_KEY_TPL.format(trip_id=trip_id, seat_id=seat_id)
+    """Attempt to create a lock for a seat. Returns dict with token and expires_at (epoch seconds, Redis clock)
+    on success, or None if already locked."""
+    key = f"seat_lock:{trip_id}:{seat_id}"
     start = time.perf_counter()
-    token = str(uuid4())
+    token = secrets.token_hex(16)
     # store token only (keeps compare-and-delete simple)
-    ok = await redis_client.set(key, token, ex=ttl, nx=True)
-    if not ok:
-        SEAT_LOCK_ATTEMPTS.labels(result="failed").inc()
+    res = await _LOCK_SCRIPT(keys=[key], args=[token, ttl])
+    if not res[0]:
+        _SL_FAILED.inc()
         return None
-    expires_at = datetime.utcnow() + timedelta(seconds=ttl)
-    SEAT_LOCK_ATTEMPTS.labels(result="success").inc()
+    expires_at = res[1]
+    _SL_SUCCESS.inc()
     SEAT_LOCK_LATENCY.observe(time.perf_counter() - start)
     return {"token": token, "expires_at": expires_at}
 
 
+# Lock tokens are secrets and are only ever compared inside Redis, where the get-compare-delete
+# runs atomically on the server. Any Python-side check of a token must go through
+# hmac.compare_digest, never `==`.
 _CAS_DEL_SCRIPT = """
 if redis.call('get', KEYS[1]) == ARGV[1] then
   return redis.call('del', KEYS[1])
@@ -33,36 +50,80 @@ else
   return 0
 end
 """
+# invoked by SHA (EVALSHA); redis-py reloads it transparently on NOSCRIPT
+_cas_del = redis_client.register_script(_CAS_DEL_SCRIPT)
 
 
 async def validate_and_consume_lock(trip_id: int, seat_id: int, token: str) -> bool:
     """Atomically validate that the lock token matches and delete it.
     Returns True if consumed, False otherwise."""
-    key = LOCK_KEY_TPL.format(trip_id=trip_id, seat_id=seat_id)
+    key = f"seat_lock:{trip_id}:{seat_id}"
     # Use Lua script to compare and delete atomically
     start = time.perf_counter()
     try:
-        res = await redis_client.eval(_CAS_DEL_SCRIPT, keys=[key], args=[token])
+        res = await _cas_del(keys=[key], args=[token])
         ok = bool(res)
         SEAT_LOCK_LATENCY.observe(time.perf_counter() - start)
-        SEAT_LOCK_ATTEMPTS.labels(result=("consumed" if ok else "invalid")).inc()
+        (_SL_CONSUMED if ok else _SL_INVALID).inc()
         return ok
     except Exception:
-        SEAT_LOCK_ATTEMPTS.labels(result="error").inc()
+        _SL_ERROR.inc()
         return False
 
 
+# A lock taken and consumed in the same script is never visible to anyone else, so
+# "SET NX then DEL" reduces to "the seat is not currently locked".
+_LOCK_AND_CONSUME_SCRIPT = redis_client.register_script("""
+if redis.call('exists', KEYS[1]) == 0 then
+  return 1
+else
+  return 0
+end
+""")
+
+
+async def lock_and_consume(trip_id: int, seat_id: int) -> bool:
+    """Lock and immediately consume a seat lock in one round-trip, for callers that book
+    straight away and never hold the token across requests. Returns False if the seat is
+    currently locked by someone else; Redis errors propagate so callers can tell an outage
+    from a conflict."""
+    key = f"seat_lock:{trip_id}:{seat_id}"
+    start = time.perf_counter()
+    try:
+        ok = bool(await _LOCK_AND_CONSUME_SCRIPT(keys=[key]))
+    except Exception:
+        _SL_ERROR.inc()
+        raise
+    SEAT_LOCK_LATENCY.observe(time.perf_counter() - start)
+    (_SL_CONSUMED if ok else _SL_FAILED).inc()
+    return ok
+
+
+# one script for both release modes: ARGV[1] == '1' deletes unconditionally (admin, token=None),
+# otherwise only a matching ARGV[2] does -- an empty client token is just a token that never
+# matches. Either way it is the same single EVALSHA on the wire
+_RELEASE_SCRIPT = """
+if ARGV[1] == '1' then
+  redis.call('del', KEYS[1])
+  return 1
+elseif redis.call('get', KEYS[1]) == ARGV[2] then
+  return redis.call('del', KEYS[1])
+else
+  return 0
+end
+"""
+_release = redis_client.register_script(_RELEASE_SCRIPT)
+
+
 async def release_lock(trip_id: int, seat_id: int, token: Optional[str] = None) -> bool:
     """Release a lock. If token is provided, only deletes when matching; if not, deletes unconditionally (admin).
     Returns True if deleted (or didn't exist), False if token mismatch."""
-    key = LOCK_KEY_TPL.format(trip_id=trip_id, seat_id=seat_id)
-    if token is None:
-        # unconditional delete
-        await redis_client.delete(key)
-        return True
-    # conditional delete
+    key = f"seat_lock:{trip_id}:{seat_id}"
     try:
-        res = await redis_client.eval(_CAS_DEL_SCRIPT, keys=[key], args=[token])
+        if token is None:
+            res = await _release(keys=[key], args=["1", ""])
+        else:
+            res = await _release(keys=[key], args=["0", token])
         return bool(res)
     except Exception:
         return False
@@ -1,6 +1,152 @@
-from app.celery_app import celery_app
+import logging
+import secrets
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, text
+from sqlalchemy.exc import DBAPIError
+
+from app.celery_app import celery_app, run_async
+from app.db.partitions import ensure_partitions_ddl
+from app.db.session import worker_engine
+from app.models.models import AuditLog
+from app.redis_client import redis_client
+from app.services.audit import AUDIT_DLQ_KEY, AUDIT_PROCESSING_KEY, AUDIT_QUEUE_KEY, audit_rows
+
+logger = logging.getLogger(__name__)
+
+AUDIT_FLUSH_BATCH_SIZE = 500
+# a claimed batch not committed within this long (worker killed, database down) is requeued
+AUDIT_PROCESSING_TIMEOUT_SECONDS = 300
+# SQLSTATE classes that mean the row itself is bad: 22 data exception (e.g. value too long),
+# 23 integrity violation (e.g. FK miss). Retrying such an event can never succeed
+AUDIT_POISON_SQLSTATE_CLASSES = ("22", "23")
+
+
+def _is_poison_audit_error(exc: Exception) -> bool:
+    if isinstance(exc, (ValueError, KeyError, TypeError)):
+        # undecodable or malformed queued event
+        return True
+    # asyncpg doesn't map every data error onto DataError, so go by the SQLSTATE
+    sqlstate = getattr(getattr(exc, "orig", None), "sqlstate", None) or ""
+    return isinstance(exc, DBAPIError) and sqlstate[:2] in AUDIT_POISON_SQLSTATE_CLASSES
+
+# LPUSH puts new events at the head, so the oldest sit at the tail: move the oldest
+# ARGV[1] events into this flush's processing list and register it, all atomically
+_claim_audit_batch = redis_client.register_script("""
+local events = redis.call('lrange', KEYS[1], -tonumber(ARGV[1]), -1)
+if #events == 0 then
+  return events
+end
+redis.call('ltrim', KEYS[1], 0, -tonumber(ARGV[1]) - 1)
+redis.call('rpush', KEYS[2], unpack(events))
+redis.call('zadd', KEYS[3], ARGV[3], ARGV[2])
+return events
+""")
+
+# push every batch claimed before ARGV[1] back onto the tail of the queue, where it is
+# picked up first again; returns the number of events requeued
+_requeue_stale_audit_batches = redis_client.register_script("""
+local requeued = 0
+for _, token in ipairs(redis.call('zrangebyscore', KEYS[2], '-inf', ARGV[1])) do
+  local key = ARGV[2] .. token
+  local events = redis.call('lrange', key, 0, -1)
+  if #events > 0 then
+    redis.call('rpush', KEYS[1], unpack(events))
+    requeued = requeued + #events
+  end
+  redis.call('del', key)
+  redis.call('zrem', KEYS[2], token)
+end
+return requeued
+""")
 
 
 @celery_app.task
 def add(x, y):
     return x + y
+
+
+@celery_app.task
+def ensure_monthly_partitions():
+    """Create this month's and next month's partitions for audit_logs and notifications."""
+    statements = ensure_partitions_ddl(datetime.now(timezone.utc).date())
+
+    async def _run():
+        async with worker_engine.begin() as conn:
+            for stmt in statements:
+                await conn.execute(text(stmt))
+
+    run_async(_run())
+    return len(statements)
+
+
+async def _insert_audit_events_singly(events):
+    """Insert `events` one per transaction; return the ones that are bad in themselves.
+
+    Any other failure (e.g. the database going away)
+    propagates, so the batch stays in its processing list and is retried as a whole."""
+    dead = []
+    for raw in events:
+        try:
+            async with worker_engine.begin() as conn:
+                await conn.execute(insert(AuditLog), audit_rows([raw]))
+        except Exception as exc:
+            if not _is_poison_audit_error(exc):
+                raise
+            logger.exception("Dead-lettering audit event to %s: %r", AUDIT_DLQ_KEY, raw)
+            dead.append(raw)
+    return dead
+
+
+@celery_app.task
+def flush_audit_queue(batch_size: int = AUDIT_FLUSH_BATCH_SIZE):
+    """Move up to `batch_size` queued audit events from Redis into audit_logs with one INSERT.
+
+    The batch stays in a processing list until the INSERT commits, so a worker dying mid-flush
+    or the database being down never loses it: batches older than AUDIT_PROCESSING_TIMEOUT_SECONDS
+    are requeued by the next flush. If the batch INSERT fails on a bad event, the events are
+    retried one by one and the ones that still fail go to AUDIT_DLQ_KEY, so one poison event
+    can't stall the queue. Delivery is at-least-once -- a flush stalled past the timeout that
+    then commits leaves its events written twice.
+    """
+
+    async def _run():
+        now = time.time()
+        requeued = await _requeue_stale_audit_batches(
+            keys=[AUDIT_QUEUE_KEY, AUDIT_PROCESSING_KEY],
+            args=[now - AUDIT_PROCESSING_TIMEOUT_SECONDS, f"{AUDIT_PROCESSING_KEY}:"],
+        )
+        if requeued:
+            logger.warning("Requeued %d audit events from abandoned flushes", requeued)
+
+        # a processing list per flush, so concurrent flushers never share (or delete) a batch
+        token = secrets.token_hex(8)
+        processing_key = f"{AUDIT_PROCESSING_KEY}:{token}"
+        events = await _claim_audit_batch(
+            keys=[AUDIT_QUEUE_KEY, processing_key, AUDIT_PROCESSING_KEY],
+            args=[batch_size, token, now],
+        )
+        if not events:
+            return 0
+        # LRANGE returns newest first; insert oldest first so ids follow created_at
+        events = list(reversed(events))
+        dead = []
+        try:
+            async with worker_engine.begin() as conn:
+                await conn.execute(insert(AuditLog), audit_rows(events))
+        except Exception as exc:
+            if not _is_poison_audit_error(exc):
+                raise
+            logger.warning("Audit batch insert failed; retrying %d events one by one", len(events))
+            dead = await _insert_audit_events_singly(events)
+        # only once the rows are durable (or dead-lettered) does the batch leave Redis
+        async with redis_client.pipeline(transaction=True) as pipe:
+            if dead:
+                pipe.rpush(AUDIT_DLQ_KEY, *dead)
+            pipe.delete(processing_key)
+            pipe.zrem(AUDIT_PROCESSING_KEY, token)
+            await pipe.execute()
+        return len(events) - len(dead)
+
+    return run_async(_run())